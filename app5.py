@@ -1,6 +1,7 @@
 from flask import Flask, request, session, redirect, url_for, jsonify
 from datetime import datetime
 import logging
+import os
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Required for session
@@ -99,4 +100,5 @@ def protected():
     return redirect('/login')
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # The reloader restarts the process on every file change; opt in with FLASK_DEBUG=1.
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1')
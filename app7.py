@@ -1,18 +1,18 @@
 from flask import Flask, request, session, redirect, url_for, jsonify
 from datetime import datetime, timezone
 import logging
-now_utc = datetime.now(timezone.utc)
+import math
+import os
+import secrets
+import time
 
-app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # Required for session
-
-# --- Set up structured logging ---
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='[%(levelname)s] %(asctime)s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+import event_log
+from detector import DEFAULT_RULES, Detector
+from event_log import EventLog
+from metrics import Metrics
+from pages import Fragments, StaticPage
+from rate_limit import RateLimiter, backend_from_url
+from user_store import MemoryUserStore, SQLiteUserStore, UserStoreBusy
 
 # Dummy user database (in-memory)
 users = {
@@ -21,90 +21,257 @@ users = {
     'jane.smith@example.com': {'password': 'janepass', 'user_id': 3}
 }
 
-# --- Home Page ---
-@app.route('/')
-def home():
-    if 'user_id' in session:
-        current_time = datetime.now(timezone.utc)
-        return f'''
-        <h2 style="color: green; font-weight: bold; font-size: 22px">Welcome to Assignment 1: Securing and Monitoring an Authenticated Flask App</h2>
-        <h2 style="color: blue; font-weight: bold; font-size: 20px"> Active User ID:   {session["user_id"]}</h2>
-        <h2 style="color: blue; font-weight: bold; font-size: 20px"> Active User Email:   {session["email"]}</h2>
-        <h2 style="color: blue; font-weight: bold; font-size: 20px"> Current UTC time: {current_time}</h2>
-        <p style="color: red; font-size: 24px"><a href="/protected">Go to protected page</a></p>
-        <form method="post" action="/logout">
-            <button type="submit">Logout</button>
-        </form>
-        '''
-    return redirect('/login')
-
-# --- Login Page and Handler ---
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
-
-        email = data.get('email')
-        password = data.get('password')
-        user = users.get(email)
-
-        if user and user['password'] == password:
-            session['user_id'] = user['user_id']
-            session['email'] = email
-
-            app.logger.info(
-                f"Login | user_id={user['user_id']} | email={email} | time={datetime.now(timezone.utc)}"
-            )
-            return redirect(url_for('home'))
 
-        app.logger.warning(
-            f"Failed login attempt | email={email} | time={datetime.now(timezone.utc)} | IP={request.remote_addr}"
+def _config_from_env():
+    env = os.environ
+    return {
+        'SECRET_KEY': env.get('APP_SECRET_KEY', 'your_secret_key'),  # Required for session
+        # LOG_MODE=events (default) queues compact event records for a background
+        # writer (requests.jsonl); LOG_MODE=text keeps the original app.log lines.
+        'LOG_MODE': env.get('LOG_MODE', 'events'),
+        'EVENT_LOG_FILE': env.get('EVENT_LOG_FILE', 'requests.jsonl'),
+        'DETECTOR_RULES': env['DETECTOR_RULES'].split(',') if env.get('DETECTOR_RULES') else DEFAULT_RULES,
+        'DETECTOR_REPLAY': env['DETECTOR_REPLAY'].split(os.pathsep) if env.get('DETECTOR_REPLAY') else [],
+        'USER_DB': env.get('USER_DB'),
+        # POST /login attempts allowed per IP and per email, as limit/seconds
+        # ('' disables). Use a shm: or sqlite: backend to share limits across
+        # serve.py workers.
+        'LOGIN_RATE_LIMIT_IP': env.get('LOGIN_RATE_LIMIT_IP', '20/60'),
+        'LOGIN_RATE_LIMIT_EMAIL': env.get('LOGIN_RATE_LIMIT_EMAIL', '5/60'),
+        'LOGIN_RATE_LIMIT_BACKEND': env.get('LOGIN_RATE_LIMIT_BACKEND', 'memory'),
+        # Per-route metrics at /metrics; METRICS_DIR lets serve.py workers share them.
+        'METRICS_ENABLED': env.get('METRICS_ENABLED', '1') != '0',
+        'METRICS_DIR': env.get('METRICS_DIR'),
+        # Auth0 (or any OIDC provider) login at /auth0/login when a domain and
+        # client are configured. AUTH0_DOMAIN may be a full URL, e.g. oidc_stub.py.
+        'AUTH0_DOMAIN': env.get('AUTH0_DOMAIN'),
+        'AUTH0_CLIENT_ID': env.get('AUTH0_CLIENT_ID'),
+        'AUTH0_CLIENT_SECRET': env.get('AUTH0_CLIENT_SECRET'),
+        'AUTH0_CALLBACK_URL': env.get('AUTH0_CALLBACK_URL', 'http://localhost:5000/callback'),
+        'AUTH0_USERINFO_TTL': int(env.get('AUTH0_USERINFO_TTL', '300')),
+    }
+
+
+def create_app(config=None):
+    """Build the app. Everything that costs time happens here, not at import."""
+    app = Flask(__name__)
+    app.config.update(_config_from_env())
+    app.config.update(config or {})
+
+    # --- Set up structured logging ---
+    if app.config['LOG_MODE'] == 'text':
+        logging.basicConfig(
+            filename='app.log',
+            level=logging.INFO,
+            format='[%(levelname)s] %(asctime)s | %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
         )
-        #return 'Invalid credentials', 401
-        return (
-            '<h2 style="color: red; font-weight: bold; font-size: 28px">Invalid credentials</h2>',
-            401,
-)
-
-    return '''
-    <h2 style="color: blue; font-weight: bold; font-size: 28px">Login</h2>
-    <form method="post" action="/login">
-        <input type="text" name="email" placeholder="Email" required />
-        <input type="password" name="password" placeholder="Password" required />
-        <button type="submit">Login</button>
-    </form>
-    '''
-
-# --- Logout Route ---
-@app.route('/logout', methods=['POST'])
-def logout():
-    user_email = session.get('email')
-    session.clear()
-    app.logger.info(
-        f"Logout | email={user_email} | time={datetime.now(timezone.utc)} | IP={request.remote_addr}"
-    )
-    return redirect('/login')
-
-
-# --- Protected Route ---
-@app.route('/protected')
-def protected():
-    if 'user_id' in session:
-        current_time = datetime.now(timezone.utc)
-        app.logger.info(
-            f"Accessed /protected | user_id={session['user_id']} | email={session['email']} | time={current_time}"
+        events = None
+    else:
+        events = EventLog(app.config['EVENT_LOG_FILE'])
+        app.extensions['event_log'] = events
+
+    # --- Real-time alert rules over the same events (see detector.py) ---
+    detector = Detector(app.config['DETECTOR_RULES'])
+    if app.config['DETECTOR_REPLAY']:
+        detector.replay(*app.config['DETECTOR_REPLAY'])
+    if events is not None:
+        events.subscribe(detector.observe_batch)
+    app.extensions['detector'] = detector
+
+    # --- Request metrics (see metrics.py) ---
+    metrics = None
+    if app.config['METRICS_ENABLED']:
+        metrics = Metrics(app.config['METRICS_DIR'])
+        metrics.init_app(app)
+
+    def log_event(event, user_id=None, email=None):
+        ip = request.remote_addr
+        if metrics is not None:
+            metrics.count_event(event)
+        if events is not None:
+            events.emit(event, user_id, email, ip)
+            return
+
+        detector.observe(event, user_id, email, ip, time.time())
+        now = datetime.now(timezone.utc)
+        if event == event_log.LOGIN:
+            app.logger.info(f"Login | user_id={user_id} | email={email} | time={now}")
+        elif event == event_log.LOGIN_FAILED:
+            app.logger.warning(f"Failed login attempt | email={email} | time={now} | IP={ip}")
+        elif event == event_log.LOGIN_THROTTLED:
+            app.logger.warning(f"Throttled login attempt | email={email} | time={now} | IP={ip}")
+        elif event == event_log.LOGOUT:
+            app.logger.info(f"Logout | email={email} | time={now} | IP={ip}")
+        elif event == event_log.PROTECTED:
+            app.logger.info(f"Accessed /protected | user_id={user_id} | email={email} | time={now}")
+        elif event == event_log.UNAUTHORIZED:
+            app.logger.warning(f"Unauthorized access attempt to /protected | IP={ip} | time={now}")
+
+    # --- User store: SQLite when USER_DB is set, otherwise the dummy users above ---
+    if app.config['USER_DB']:
+        user_store = SQLiteUserStore(app.config['USER_DB'])
+        if user_store.is_empty():
+            user_store.bulk_import((email, u['password'], u['user_id']) for email, u in users.items())
+    else:
+        user_store = MemoryUserStore(users)
+    app.extensions['user_store'] = user_store
+
+    # --- Login throttling, checked before any password work ---
+    limit_backend = backend_from_url(app.config['LOGIN_RATE_LIMIT_BACKEND'])
+    ip_limiter = email_limiter = None
+    if app.config['LOGIN_RATE_LIMIT_IP']:
+        ip_limiter = RateLimiter.parse(app.config['LOGIN_RATE_LIMIT_IP'], limit_backend, 'ip:')
+    if app.config['LOGIN_RATE_LIMIT_EMAIL']:
+        email_limiter = RateLimiter.parse(app.config['LOGIN_RATE_LIMIT_EMAIL'], limit_backend, 'email:')
+
+    def throttled(email, retry_after):
+        log_event(event_log.LOGIN_THROTTLED, email=email)
+        return 'Too many login attempts', 429, {'Retry-After': str(math.ceil(retry_after))}
+
+    # --- Pages: templates compiled and pre-rendered once at startup ---
+    home_page = Fragments(app.jinja_env.get_template('app7_home.html'), 'user_id', 'email', 'current_time')
+    protected_page = Fragments(app.jinja_env.get_template('app7_protected.html'), 'email', 'current_time')
+    login_page = StaticPage(app.jinja_env.get_template('login.html'))
+
+    # --- Auth0 / OIDC login: cached discovery, JWKS and userinfo (see oidc.py) ---
+    if app.config['AUTH0_DOMAIN'] and app.config['AUTH0_CLIENT_ID']:
+        # Imported here so password-only deployments do not need the JOSE stack.
+        from oidc import OIDCClient, OIDCError, issuer_from_domain
+
+        oidc_client = OIDCClient(
+            issuer_from_domain(app.config['AUTH0_DOMAIN']),
+            app.config['AUTH0_CLIENT_ID'],
+            app.config['AUTH0_CLIENT_SECRET'],
+            app.config['AUTH0_CALLBACK_URL'],
+            userinfo_ttl=app.config['AUTH0_USERINFO_TTL'],
         )
-        return f'''
-        <h2 style="color: green; font-size: 32px">Protected Content</h2>
-        <p style="color: blue; font-weight: bold; font-size: 20px">Hello {session["email"]}, this is a protected page.</p>
-        <p style="color: blue; font-size: 18px">Current UTC time: {current_time}</p>
-        <a href="/">Go back home</a>
-        '''
-    
-    app.logger.warning(
-        f"Unauthorized access attempt to /protected | IP={request.remote_addr} | time={datetime.now(timezone.utc)}"
-    )
-    return redirect('/login')
+        oidc_client.provider.start()
+        app.extensions['oidc'] = oidc_client
+
+        @app.route('/auth0/login')
+        def auth0_login():
+            state, nonce = secrets.token_urlsafe(16), secrets.token_urlsafe(16)
+            session['oidc'] = {'state': state, 'nonce': nonce}
+            try:
+                return redirect(oidc_client.authorize_url(state, nonce))
+            except OIDCError as e:
+                app.logger.error(f"Auth0 unavailable | {e}")
+                return 'Login provider unavailable', 502
+
+        @app.route('/callback')
+        def callback():
+            pending = session.pop('oidc', None)
+            if pending is None or request.args.get('state') != pending['state'] or 'code' not in request.args:
+                log_event(event_log.LOGIN_FAILED)
+                return 'Invalid login response', 400
+            try:
+                token = oidc_client.fetch_token(request.args['code'])
+                claims = oidc_client.verify_id_token(token['id_token'], pending['nonce'])
+            except OIDCError as e:
+                app.logger.warning(f"Auth0 login failed | {e}")
+                log_event(event_log.LOGIN_FAILED)
+                return 'Login failed', 401
+
+            userinfo = oidc_client.userinfo(claims, token.get('access_token'))
+            session['user_id'] = claims['sub']
+            session['email'] = userinfo.get('email')
+            session['userinfo'] = userinfo
+            log_event(event_log.LOGIN, claims['sub'], session['email'])
+            return redirect(url_for('home'))
+
+    # --- Home Page ---
+    @app.route('/')
+    def home():
+        if 'user_id' in session:
+            return home_page.render(
+                user_id=session['user_id'],
+                email=session['email'],
+                current_time=datetime.now(timezone.utc),
+            )
+        return redirect('/login')
+
+    # --- Login Page and Handler ---
+    @app.route('/login', methods=['GET', 'POST'])
+    def login():
+        if request.method == 'POST':
+            if ip_limiter is not None:
+                retry_after = ip_limiter.hit(request.remote_addr)
+                if retry_after:
+                    return throttled(None, retry_after)
+
+            data = request.get_json(silent=True) if request.is_json else request.form
+            if not isinstance(data, dict):
+                data = {}
+
+            # JSON bodies can carry any type; anything but strings is just bad credentials.
+            email = data.get('email')
+            password = data.get('password')
+            if not isinstance(email, str):
+                email = None
+            if not isinstance(password, str):
+                password = None
+            if email_limiter is not None and email:
+                retry_after = email_limiter.hit(email)
+                if retry_after:
+                    return throttled(email, retry_after)
+
+            try:
+                user = user_store.verify(email, password)
+            except UserStoreBusy:
+                return 'Too many login attempts in progress, try again shortly', 503, {'Retry-After': '1'}
+
+            if user:
+                session['user_id'] = user['user_id']
+                session['email'] = email
+
+                log_event(event_log.LOGIN, user['user_id'], email)
+                return redirect(url_for('home'))
+
+            log_event(event_log.LOGIN_FAILED, email=email)
+            #return 'Invalid credentials', 401
+            return (
+                '<h2 style="color: red; font-weight: bold; font-size: 28px">Invalid credentials</h2>',
+                401,
+            )
+
+        return login_page.response(request)
+
+    # --- Logout Route ---
+    @app.route('/logout', methods=['POST'])
+    def logout():
+        user_email = session.get('email')
+        session.clear()
+        log_event(event_log.LOGOUT, email=user_email)
+        return redirect('/login')
+
+    # --- Protected Route ---
+    @app.route('/protected')
+    def protected():
+        if 'user_id' in session:
+            log_event(event_log.PROTECTED, session['user_id'], session['email'])
+            return protected_page.render(email=session['email'], current_time=datetime.now(timezone.utc))
+
+        log_event(event_log.UNAUTHORIZED)
+        return redirect('/login')
+
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `app7:app` (flask run, WSGI servers) still works, but the app is only
+    # built when first asked for rather than on import.
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(name)
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # The reloader restarts the process on every file change; opt in with FLASK_DEBUG=1.
+    create_app().run(debug=os.environ.get('FLASK_DEBUG') == '1')
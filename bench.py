@@ -0,0 +1,351 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+# Rate limits are off so repeated bad logins measure the password path, not 429s.
+BENCH_CONFIG = {
+    'LOGIN_RATE_LIMIT_IP': '',
+    'LOGIN_RATE_LIMIT_EMAIL': '',
+}
+
+# SocketClient.request takes a ``json`` argument like the Flask test client.
+_json_dumps = json.dumps
+
+USERS = [
+    ('admin@example.com', 'admin123'),
+    ('john.doe@example.com', 'johnpass'),
+    ('jane.smith@example.com', 'janepass'),
+]
+
+
+# --- Clients ---
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json=None, data=None):
+        return self.client.open(path, method=method, json=json, data=data).status_code
+
+
+class SocketClient:
+    """Keep-alive HTTP client that carries the Flask session cookie."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookies = {}
+
+    def request(self, method, path, json=None, data=None):
+        headers = {}
+        body = None
+        if json is not None:
+            body = _json_dumps(json)
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        except (OSError, http.client.HTTPException):
+            # The server closed the keep-alive connection; retry once on a new one.
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        response.read()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, rest = header.partition('=')
+            value = rest.split(';', 1)[0]
+            if value and 'Expires=Thu, 01 Jan 1970' not in header:
+                self.cookies[name] = value
+            else:
+                self.cookies.pop(name, None)
+        return response.status
+
+
+# --- Session flow ---
+def run_session(client, record, index, burst):
+    """login page -> login (JSON or form) -> home -> /protected burst -> logout
+    -> unauthorized /protected -> bad credentials."""
+    email, password = USERS[index % len(USERS)]
+
+    def step(label, expect, method, path, **kwargs):
+        started = time.perf_counter()
+        status = client.request(method, path, **kwargs)
+        record(label, time.perf_counter() - started, status, expect)
+
+    step('GET /login', 200, 'GET', '/login')
+    if index % 2:
+        step('POST /login (form)', 302, 'POST', '/login', data={'email': email, 'password': password})
+    else:
+        step('POST /login (json)', 302, 'POST', '/login', json={'email': email, 'password': password})
+    step('GET /', 200, 'GET', '/')
+    for _ in range(burst):
+        step('GET /protected', 200, 'GET', '/protected')
+    step('POST /logout', 302, 'POST', '/logout')
+    step('GET /protected (unauthorized)', 302, 'GET', '/protected')
+    step('POST /login (bad credentials)', 401, 'POST', '/login', json={'email': email, 'password': 'wrong'})
+
+
+def _run_threads(make_client, threads, sessions, burst, offset=0):
+    latencies = {}
+    errors = {}
+    throttled = [0]
+    lock = threading.Lock()
+
+    def worker(n):
+        local_latencies = {}
+        local_errors = {}
+        local_throttled = 0
+
+        def record(label, seconds, status, expect):
+            nonlocal local_throttled
+            local_latencies.setdefault(label, []).append(seconds)
+            if status != expect:
+                local_errors[label] = local_errors.get(label, 0) + 1
+                if status == 429:
+                    local_throttled += 1
+
+        client = make_client()
+        for i in range(sessions):
+            run_session(client, record, offset + n * sessions + i, burst)
+        with lock:
+            for label, values in local_latencies.items():
+                latencies.setdefault(label, []).extend(values)
+            for label, count in local_errors.items():
+                errors[label] = errors.get(label, 0) + count
+            throttled[0] += local_throttled
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies, errors, throttled[0]
+
+
+def run_in_process(threads, sessions, burst, config=None):
+    from app7 import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({**BENCH_CONFIG, 'EVENT_LOG_FILE': os.path.join(tmp, 'events.jsonl'), **(config or {})})
+        started = time.perf_counter()
+        latencies, errors, throttled = _run_threads(lambda: InProcessClient(app), threads, sessions, burst)
+        wall = time.perf_counter() - started
+        events = app.extensions.get('event_log')
+        if events is not None:
+            events.close()
+    return latencies, errors, wall, throttled
+
+
+def _socket_process(host, port, threads, sessions, burst, offset):
+    return _run_threads(lambda: SocketClient(host, port), threads, sessions, burst, offset)
+
+
+def run_sockets(host, port, procs, threads, sessions, burst):
+    latencies = {}
+    errors = {}
+    throttled = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(procs) as pool:
+        futures = [
+            pool.submit(_socket_process, host, port, threads, sessions, burst, p * threads * sessions)
+            for p in range(procs)
+        ]
+        for future in futures:
+            part_latencies, part_errors, part_throttled = future.result()
+            throttled += part_throttled
+            for label, values in part_latencies.items():
+                latencies.setdefault(label, []).extend(values)
+            for label, count in part_errors.items():
+                errors[label] = errors.get(label, 0) + count
+    return latencies, errors, time.perf_counter() - started, throttled
+
+
+def _hook_cost(config, n=20000):
+    """Seconds per request spent in before/after-request processing."""
+    from app7 import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({**BENCH_CONFIG, 'EVENT_LOG_FILE': os.path.join(tmp, 'events.jsonl'), **config})
+        with app.test_request_context('/protected'):
+            response = app.make_response('')
+            started = time.perf_counter()
+            for _ in range(n):
+                app.preprocess_request()
+                app.process_response(response)
+            return (time.perf_counter() - started) / n
+
+
+def metrics_overhead(threads, sessions, burst, rounds=5, port=5098, workers=1, procs=1, socket_rounds=3):
+    """Print the per-request cost of the metrics hooks: isolated, in-process and over sockets."""
+    from bench_serve import start_server
+
+    hooks = {False: [], True: []}
+    medians = {False: [], True: []}
+    # Alternate the two configurations so machine noise hits both equally.
+    for _ in range(rounds):
+        for enabled in (False, True):
+            config = {'METRICS_ENABLED': enabled}
+            hooks[enabled].append(_hook_cost(config))
+            latencies, *_ = run_in_process(threads, sessions, burst, config)
+            medians[enabled].append(percentile(sorted(v for route in latencies.values() for v in route), 50))
+
+    # serve.py runs werkzeug's threaded server (a thread per connection), which
+    # is where shard locking would show up.
+    socket_medians = {False: [], True: []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(socket_rounds):
+            for enabled in (False, True):
+                env = {**BENCH_CONFIG, 'EVENT_LOG_FILE': os.path.join(tmp, 'events.jsonl'),
+                       'METRICS_ENABLED': '1' if enabled else '0'}
+                with start_server(workers, port, env=env):
+                    latencies, *_ = run_sockets('127.0.0.1', port, procs, threads, sessions, burst)
+                socket_medians[enabled].append(
+                    percentile(sorted(v for route in latencies.values() for v in route), 50))
+
+    hook_cost = (min(hooks[True]) - min(hooks[False])) * 1e6
+    end_to_end = (min(medians[True]) - min(medians[False])) * 1e6
+    over_sockets = (min(socket_medians[True]) - min(socket_medians[False])) * 1e6
+    print(f'request hooks:  {hook_cost:8.2f} us/request added by metrics')
+    print(f'in-process:     {end_to_end:8.2f} us/request (median latency {min(medians[True]) * 1e6:.1f} us)')
+    print(f'over sockets:   {over_sockets:8.2f} us/request (median latency {min(socket_medians[True]) * 1e6:.1f} us, '
+          f'{workers} worker(s), thread per connection)')
+    return 0
+
+
+# --- Reporting ---
+def percentile(sorted_values, pct):
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, wall, throttled=0):
+    routes = {}
+    for label, values in latencies.items():
+        values.sort()
+        routes[label] = {
+            'count': len(values),
+            'errors': errors.get(label, 0),
+            'rps': len(values) / wall,
+            'p50_ms': percentile(values, 50) * 1e3,
+            'p95_ms': percentile(values, 95) * 1e3,
+            'p99_ms': percentile(values, 99) * 1e3,
+        }
+    total = sum(r['count'] for r in routes.values())
+    return {'wall_s': wall, 'rps': total / wall, 'routes': routes, 'throttled': throttled}
+
+
+def print_report(mode, summary):
+    print(f'\n== {mode}: {summary["rps"]:.1f} req/s over {summary["wall_s"]:.2f} s')
+    print(f'{"route":<32} {"count":>7} {"errors":>6} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for label, r in sorted(summary['routes'].items()):
+        print(f'{label:<32} {r["count"]:>7} {r["errors"]:>6} {r["rps"]:>9.1f} '
+              f'{r["p50_ms"]:>8.2f} {r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f}')
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regressions: p95 slower or throughput lower than ``threshold`` allows."""
+    problems = []
+    for mode, summary in results.items():
+        base = baseline.get(mode)
+        if not base:
+            continue
+        for label, r in summary['routes'].items():
+            b = base['routes'].get(label)
+            if not b:
+                continue
+            if r['p95_ms'] > b['p95_ms'] * (1 + threshold):
+                problems.append(f'{mode} {label}: p95 {r["p95_ms"]:.2f} ms vs baseline {b["p95_ms"]:.2f} ms')
+            if r['rps'] < b['rps'] * (1 - threshold):
+                problems.append(f'{mode} {label}: {r["rps"]:.1f} req/s vs baseline {b["rps"]:.1f} req/s')
+            if r['errors'] > b['errors']:
+                problems.append(f'{mode} {label}: {r["errors"]} unexpected statuses (baseline {b["errors"]})')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the login -> protected -> logout flow of app7.py.')
+    parser.add_argument('--mode', choices=('inprocess', 'socket', 'both'), default='both')
+    parser.add_argument('--threads', type=int, default=4, help='concurrent sessions per process')
+    parser.add_argument('--sessions', type=int, default=25, help='flows per thread')
+    parser.add_argument('--burst', type=int, default=10, help='/protected hits per session')
+    parser.add_argument('--procs', type=int, default=2, help='client processes (socket mode)')
+    parser.add_argument('--url', help='benchmark an already running server instead of starting serve.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='serve.py workers (socket mode)')
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--hash-iterations', type=int,
+                        help='PASSWORD_HASH_ITERATIONS for the app under test (lower = faster logins)')
+    parser.add_argument('--metrics-overhead', action='store_true',
+                        help='run the in-process flow with and without /metrics instrumentation and compare')
+    parser.add_argument('--save', metavar='FILE', help='write results as a new baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative regression before failing (default 0.25)')
+    args = parser.parse_args(argv)
+
+    if args.hash_iterations:
+        os.environ['PASSWORD_HASH_ITERATIONS'] = str(args.hash_iterations)
+    # The flow trips the default alert rules on purpose; keep the report readable.
+    logging.getLogger('detector').setLevel(logging.ERROR)
+
+    if args.metrics_overhead:
+        return metrics_overhead(args.threads, args.sessions, args.burst, port=args.port,
+                                workers=args.workers, procs=args.procs)
+
+    results = {}
+    if args.mode in ('inprocess', 'both'):
+        results['inprocess'] = summarize(*run_in_process(args.threads, args.sessions, args.burst))
+        print_report('inprocess', results['inprocess'])
+
+    if args.mode in ('socket', 'both'):
+        if args.url:
+            parts = urlsplit(args.url)
+            run = run_sockets(parts.hostname, parts.port or 80, args.procs, args.threads, args.sessions, args.burst)
+        else:
+            from bench_serve import start_server
+
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {**BENCH_CONFIG, 'EVENT_LOG_FILE': os.path.join(tmp, 'events.jsonl')}
+                with start_server(args.workers, args.port, env=env):
+                    run = run_sockets('127.0.0.1', args.port, args.procs, args.threads, args.sessions, args.burst)
+        results['socket'] = summarize(*run)
+        print_report('socket', results['socket'])
+        if results['socket']['throttled']:
+            # Only servers started by bench.py get BENCH_CONFIG; 429s would
+            # make every number (and any saved baseline) meaningless.
+            print(f'\n{results["socket"]["throttled"]} requests were rate limited (429). Start the server '
+                  'with LOGIN_RATE_LIMIT_IP= LOGIN_RATE_LIMIT_EMAIL= to benchmark it.', file=sys.stderr)
+            return 2
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'\nSaved baseline to {args.save}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(results, json.load(f), args.threshold)
+        if problems:
+            print('\nRegressions:', file=sys.stderr)
+            for problem in problems:
+                print(f'  {problem}', file=sys.stderr)
+            return 1
+        print(f'\nNo regressions beyond {args.threshold:.0%} of {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,102 @@
+import argparse
+import contextlib
+import http.client
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+_READY = re.compile(r'worker \d+ ready in ([\d.]+) ms')
+
+
+def _client(host, port, path, duration, threads):
+    """Hammer ``path`` over keep-alive connections; returns completed requests."""
+    done = [0] * threads
+    deadline = time.monotonic() + duration
+
+    def loop(i):
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        while time.monotonic() < deadline:
+            try:
+                conn.request('GET', path)
+                conn.getresponse().read()
+                done[i] += 1
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=10)
+        conn.close()
+
+    pool = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sum(done)
+
+
+@contextlib.contextmanager
+def start_server(workers, port, app='app7:create_app', env=None, timeout=60):
+    """Run ``serve.py`` until the block exits; yields the per-worker ready times (ms)."""
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+         app, '-w', str(workers), '-b', f'127.0.0.1:{port}'],
+        stderr=subprocess.PIPE, text=True, env={**os.environ, **(env or {})},
+    )
+    ready = []
+    all_ready = threading.Event()
+
+    def watch():
+        for line in proc.stderr:
+            match = _READY.search(line)
+            if match:
+                ready.append(float(match.group(1)))
+                if len(ready) >= workers:
+                    all_ready.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        if not all_ready.wait(timeout):
+            raise RuntimeError(f'{workers} workers did not start')
+        yield ready
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(30)
+
+
+def measure(workers, port, path='/login', duration=5.0, clients=2, threads=8, app='app7:create_app'):
+    """Start ``serve.py`` with ``workers`` processes and return (startup ms, worker ready ms, req/s)."""
+    started = time.monotonic()
+    with start_server(workers, port, app) as ready:
+        startup = (time.monotonic() - started) * 1e3
+        with ProcessPoolExecutor(clients) as pool:
+            futures = [pool.submit(_client, '127.0.0.1', port, path, duration, threads) for _ in range(clients)]
+            total = sum(f.result() for f in futures)
+    return startup, sum(ready) / len(ready), total / duration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure serve.py startup time and throughput per worker count.')
+    parser.add_argument('--workers', default=f'1,2,4,{os.cpu_count() or 1}', help='comma-separated worker counts')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--path', default='/login')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of load per run')
+    parser.add_argument('--clients', type=int, default=2, help='load generator processes')
+    parser.add_argument('--threads', type=int, default=8, help='connections per load generator')
+    parser.add_argument('--app', default='app7:create_app')
+    args = parser.parse_args(argv)
+
+    counts = sorted({int(n) for n in args.workers.split(',')})
+    print(f'{"workers":>7} {"startup ms":>11} {"worker ms":>10} {"req/s":>9}')
+    for n in counts:
+        startup, worker_ms, rps = measure(n, args.port, args.path, args.duration,
+                                          args.clients, args.threads, args.app)
+        print(f'{n:>7} {startup:>11.1f} {worker_ms:>10.1f} {rps:>9.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
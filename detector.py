@@ -0,0 +1,160 @@
+import argparse
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+from log_lines import iter_events, parse_tz
+
+Alert = namedtuple('Alert', 'rule key count ts')
+
+_KEYS = {'user_id': 1, 'email': 2, 'ip': 3}
+
+logger = logging.getLogger('detector')
+
+
+class Rule:
+    """Alert when ``key`` produces more than ``threshold`` ``event``s in ``window`` seconds.
+
+    Counts are kept in ``buckets`` ring slots per key, so an update is O(1)
+    amortized and memory is bounded by ``max_keys`` (least recently seen keys
+    are evicted first).
+    """
+
+    def __init__(self, name, event, key, threshold, window, buckets=15, max_keys=100000):
+        if key not in _KEYS:
+            raise ValueError(f'unknown rule key: {key}')
+        self.name = name
+        self.event = event
+        self.key = key
+        self.threshold = threshold
+        self.window = window
+        self.buckets = buckets
+        self.max_keys = max_keys
+        self._field = _KEYS[key]
+        self._width = window / buckets
+        # key -> [slot counts, last slot, total, quiet until slot]
+        self._counters = OrderedDict()
+
+    @classmethod
+    def parse(cls, spec):
+        """Build a rule from ``name:event:key:threshold:window_seconds``."""
+        name, event, key, threshold, window = spec.split(':')
+        return cls(name, event, key, int(threshold), float(window))
+
+    def update(self, record, ts):
+        key = record[self._field]
+        if key is None:
+            return None
+        n = self.buckets
+        slot = int(ts // self._width)
+        counters = self._counters
+        entry = counters.get(key)
+        if entry is None:
+            entry = counters[key] = [[0] * n, slot, 0, slot]
+            if len(counters) > self.max_keys:
+                counters.popitem(last=False)
+        else:
+            counters.move_to_end(key)
+
+        counts, last = entry[0], entry[1]
+        if slot > last:
+            if slot - last >= n:
+                counts[:] = [0] * n
+                entry[2] = 0
+            else:
+                for s in range(last + 1, slot + 1):
+                    entry[2] -= counts[s % n]
+                    counts[s % n] = 0
+            entry[1] = slot
+        elif last - slot >= n:
+            return None  # Older than the window; nothing to count.
+
+        counts[slot % n] += 1
+        entry[2] += 1
+        if entry[2] > self.threshold and slot >= entry[3]:
+            # One alert per key per window.
+            entry[3] = slot + n
+            return Alert(self.name, key, entry[2], ts)
+        return None
+
+
+DEFAULT_RULES = (
+    # Same rule as the Log Analytics query in the README.
+    'protected_burst:protected:user_id:10:900',
+    'failed_login_ip:login_failed:ip:5:300',
+    'failed_login_email:login_failed:email:5:300',
+    'unauthorized_ip:unauthorized:ip:20:300',
+)
+
+
+def log_alert(alert):
+    logger.warning(
+        f"Alert | rule={alert.rule} | key={alert.key} | count={alert.count} | ts={alert.ts:.3f}"
+    )
+
+
+class Detector:
+    """Streaming threshold rules over the events emitted by the handlers."""
+
+    def __init__(self, rules=DEFAULT_RULES, on_alert=log_alert):
+        self.on_alert = on_alert
+        self._rules = {}
+        for rule in rules:
+            if isinstance(rule, str):
+                rule = Rule.parse(rule)
+            self._rules.setdefault(rule.event, []).append(rule)
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self):
+        return [rule for rules in self._rules.values() for rule in rules]
+
+    def observe(self, event, user_id=None, email=None, ip=None, ts=0.0):
+        self.observe_batch([(event, user_id, email, ip, ts)])
+
+    def observe_batch(self, records):
+        """Feed ``(event, user_id, email, ip, ts)`` tuples, e.g. an EventLog batch."""
+        alerts = []
+        with self._lock:
+            for record in records:
+                for rule in self._rules.get(record[0], ()):
+                    alert = rule.update(record, record[4])
+                    if alert is not None:
+                        alerts.append(alert)
+        for alert in alerts:
+            self.on_alert(alert)
+
+    def replay(self, *paths, chunk=4096, utc_offset=None):
+        """Backfill the counters from existing app.log / requests.jsonl files.
+
+        ``utc_offset`` overrides the zone of asctime-only lines (see ``iter_events``).
+        """
+        for path in paths:
+            batch = []
+            for record in iter_events(path, utc_offset):
+                batch.append(record)
+                if len(batch) >= chunk:
+                    self.observe_batch(batch)
+                    batch = []
+            self.observe_batch(batch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay app logs through the alert rules.')
+    parser.add_argument('paths', nargs='+', help='app.log / requests.jsonl files, oldest first')
+    parser.add_argument('--rule', action='append', dest='rules',
+                        help='name:event:key:threshold:window_seconds (repeatable)')
+    parser.add_argument('--tz', type=parse_tz,
+                        help="UTC offset of the logs' asctime, e.g. -04:00 (default: learned from time= fields)")
+    args = parser.parse_args(argv)
+
+    alerts = []
+    detector = Detector(args.rules or DEFAULT_RULES, on_alert=alerts.append)
+    detector.replay(*args.paths, utc_offset=args.tz)
+    for alert in alerts:
+        print(f"{alert.rule}\t{alert.key}\t{alert.count}\t{alert.ts:.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
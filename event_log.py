@@ -0,0 +1,247 @@
+import atexit
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+# --- Event types emitted by the request handlers ---
+LOGIN = 'login'
+LOGIN_FAILED = 'login_failed'
+LOGIN_THROTTLED = 'login_throttled'
+LOGOUT = 'logout'
+PROTECTED = 'protected'
+UNAUTHORIZED = 'unauthorized'
+
+logger = logging.getLogger('event_log')
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+class EventLog:
+    """Batched JSON-lines event writer fed through a bounded queue.
+
+    Request handlers call ``emit()``, which only appends a small tuple to a
+    deque. A background thread drains it every ``flush_interval`` seconds,
+    formats the records, appends them to ``path`` in batches and rotates the
+    file by size and age. It is woken early once ``batch_size`` records are
+    waiting. Records shed under backpressure or lost to write errors are
+    counted in ``dropped`` and reported on the ``event_log`` logger.
+
+    Several processes (``serve.py`` workers) may share ``path``: rotation is
+    serialized with a lock on ``path.lock``, and the other writers reopen
+    the new file when they see theirs was renamed.
+    """
+
+    def __init__(self, path='requests.jsonl', max_queue=10000, batch_size=256,
+                 flush_interval=1.0, max_bytes=10 * 1024 * 1024, max_age=24 * 3600,
+                 backup_count=5, block_timeout=0.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.block_timeout = block_timeout
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._reported = 0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._file = None
+        self._inode = None
+        self._lock_path = f'{path}.lock'
+        self._opened_at = 0.0
+        # Monotonic timestamps are turned into wall-clock time off the request path.
+        self._wall_offset = time.time() - time.monotonic()
+        self._encoded = {}
+        self._seconds = {}
+        atexit.register(self.close)
+
+    # --- Request side ---
+    def emit(self, event, user_id=None, email=None, ip=None):
+        if self._pid != os.getpid():
+            self._start()
+        record = (event, user_id, email, ip, time.monotonic())
+        q = self._queue
+        if len(q) >= self.max_queue:
+            # Backpressure: nudge the writer and wait briefly if allowed,
+            # otherwise shed the record.
+            self._wakeup.set()
+            deadline = time.monotonic() + self.block_timeout
+            while len(q) >= self.max_queue:
+                if time.monotonic() >= deadline:
+                    self.dropped += 1
+                    return
+                time.sleep(0.001)
+        q.append(record)
+        n = len(q)
+        if n >= self.batch_size:
+            if not self._wakeup.is_set():
+                self._wakeup.set()
+            if n >= self.max_queue // 2:
+                # The writer is falling behind: give it the GIL before shedding starts.
+                time.sleep(0)
+
+    def subscribe(self, callback):
+        """Call ``callback(records)`` from the writer thread for every batch.
+
+        Records are ``(event, user_id, email, ip, ts)`` with ``ts`` in POSIX time.
+        """
+        self._subscribers.append(callback)
+
+    def close(self):
+        with self._lock:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+            self._thread = None
+        self._wakeup.set()
+        thread.join()
+
+    # --- Writer side ---
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads do not survive fork, so each worker process gets its own
+            # queue and writer.
+            if self._pid is not None:
+                self._queue = deque()
+                self._wakeup = threading.Event()
+                self._file = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='event-log', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        q = self._queue
+        wakeup = self._wakeup
+        while True:
+            stopping = self._thread is None
+            wakeup.wait(self.flush_interval)
+            wakeup.clear()
+            while q:
+                batch = [q.popleft() for _ in range(min(len(q), self.batch_size))]
+                # Subscribers see every batch, even one the file write loses.
+                self._notify(batch)
+                try:
+                    self._write(batch)
+                except Exception:
+                    # Keep the writer alive (full disk, removed directory, ...);
+                    # the file is reopened for the next batch.
+                    logger.exception('event log write to %s failed', self.path)
+                    self.dropped += len(batch)
+                    self._close_file()
+            if self.dropped != self._reported:
+                logger.warning('event log dropped %d records (%d total)',
+                               self.dropped - self._reported, self.dropped)
+                self._reported = self.dropped
+            if stopping or self._thread is None:
+                break
+        self._close_file()
+
+    def _write(self, batch):
+        offset = self._wall_offset
+        encoded = self._encoded
+        seconds = self._seconds
+        lines = []
+        for event, user_id, email, ip, mono in batch:
+            # Events, ids, emails and IPs repeat a lot; json-encode each value
+            # once instead of dumping a dict per record.
+            fields = []
+            for value in (event, user_id, email, ip):
+                text = encoded.get(value)
+                if text is None:
+                    if len(encoded) >= 4096:
+                        encoded.clear()
+                    text = encoded[value] = _encode(value)
+                fields.append(text)
+            wall = mono + offset
+            second = int(wall)
+            prefix = seconds.get(second)
+            if prefix is None:
+                seconds.clear()
+                prefix = seconds[second] = datetime.fromtimestamp(second, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            lines.append(
+                f'{{"event":{fields[0]},"user_id":{fields[1]},"email":{fields[2]},"ip":{fields[3]},'
+                f'"mono":{mono:.6f},"time":"{prefix}.{int((wall - second) * 1e6):06d}+00:00"}}'
+            )
+        data = '\n'.join(lines) + '\n'
+
+        data = data.encode('utf-8')
+        f = self._open()
+        if self._should_rotate(f, len(data)):
+            f = self._rotate(len(data))
+        f.write(data)
+
+    def _notify(self, batch):
+        if not self._subscribers:
+            return
+        # Subscribers see POSIX timestamps so live and replayed events line up.
+        offset = self._wall_offset
+        batch = [(event, user_id, email, ip, mono + offset)
+                 for event, user_id, email, ip, mono in batch]
+        for callback in self._subscribers:
+            try:
+                callback(batch)
+            except Exception:
+                logger.exception('event log subscriber %r failed', callback)
+
+    def _close_file(self):
+        f, self._file = self._file, None
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def _open(self):
+        if self._file is not None:
+            try:
+                moved = os.stat(self.path).st_ino != self._inode
+            except FileNotFoundError:
+                moved = True
+            if not moved:
+                return self._file
+            # Another process rotated the file; follow it to the new one.
+            self._close_file()
+        # Unbuffered binary appends: each batch is one write(), so batches from
+        # several worker processes never interleave mid-line.
+        self._file = open(self.path, 'ab', buffering=0)
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        # The lock file's mtime marks the last rotation, shared by every process.
+        with open(self._lock_path, 'a'):
+            self._opened_at = os.stat(self._lock_path).st_mtime
+        return self._file
+
+    def _should_rotate(self, f, incoming):
+        size = os.fstat(f.fileno()).st_size
+        if self.max_bytes and size and size + incoming > self.max_bytes:
+            return True
+        return bool(self.max_age and time.time() - self._opened_at > self.max_age)
+
+    def _rotate(self, incoming):
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Re-check under the lock: another worker may have just rotated.
+            if not self._should_rotate(self._open(), incoming):
+                return self._file
+            self._close_file()
+            if self.backup_count:
+                for i in range(self.backup_count - 1, 0, -1):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+                with contextlib.suppress(FileNotFoundError):
+                    os.replace(self.path, f'{self.path}.1')
+            else:
+                open(self.path, 'w').close()
+            os.utime(self._lock_path)
+            return self._open()
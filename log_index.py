@@ -0,0 +1,450 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import mmap
+import operator
+import os
+import re
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import compress, repeat, tee
+
+from log_lines import (ACCESS, OffsetTracker, detect_utc_offset, parse_access_line, parse_json_line,
+                       parse_line, parse_tz)
+
+# name -> array typecode. Values of the string columns are ids into strings.json; 0 = none.
+COLUMNS = {
+    'ts': 'd',
+    'event': 'B',
+    'user_id': 'I',
+    'email': 'I',
+    'ip': 'I',
+    'method': 'I',
+    'path': 'I',
+    'status': 'H',
+}
+# user_id is an int for local accounts and the OIDC ``sub`` string for Auth0 logins.
+STRING_COLUMNS = ('user_id', 'email', 'ip', 'method', 'path')
+# Bumped when the column layout changes; older indexes are rebuilt from scratch.
+FORMAT = 2
+EVENTS = [ACCESS, 'login', 'login_failed', 'login_throttled', 'logout', 'protected', 'unauthorized']
+# bytes.translate() tables turning an event column slice into a 0/1 mask per event code.
+_EVENT_MASKS = [bytes(int(i == code) for i in range(256)) for code in range(len(EVENTS))]
+_HEAD_BYTES = 4096
+_CHUNK_ROWS = 100000
+
+
+def discover(path):
+    """``path`` plus its rotated archives (``path.1``, ``path.2.gz``, ...), oldest first."""
+    rotated = []
+    for candidate in glob.glob(glob.escape(path) + '.*'):
+        suffix = candidate[len(path) + 1:].removesuffix('.gz')
+        if suffix.isdigit():
+            rotated.append((int(suffix), candidate))
+    return [p for _, p in sorted(rotated, reverse=True)] + ([path] if os.path.exists(path) else [])
+
+
+def _open_binary(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def _head(path):
+    with _open_binary(path) as f:
+        return f.read(_HEAD_BYTES)
+
+
+class LogIndex:
+    """Columnar, memory-mapped index over app.log history.
+
+    Each column is a flat binary array file in ``directory``; queries map
+    them read-only and run over ``memoryview`` slices with C-level iterators
+    (``compress``/``Counter``), so they never re-parse the logs. ``update()``
+    only parses bytes appended since the last run and recognizes files that
+    were rotated or gzipped by the first bytes of their content.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = {'format': FORMAT, 'rows': 0, 'sorted': True, 'last_ts': 0.0, 'sources': []}
+        self.strings = [None]
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            # update() truncates the columns of an outdated index to zero rows.
+            if meta.get('format') == FORMAT:
+                self.meta = meta
+                with open(os.path.join(directory, 'strings.json'), encoding='utf-8') as f:
+                    self.strings = json.load(f)
+        self._string_ids = {s: i for i, s in enumerate(self.strings)}
+        self._maps = {}
+        self._columns = None
+
+    # --- Building ---
+    def update(self, paths, utc_offset=None):
+        """Index new lines from ``paths`` (oldest first). Returns rows added.
+
+        asctime-only lines (access lines, older handler lines) are read at
+        ``utc_offset`` seconds east of UTC if given, otherwise in the writer's
+        zone as learned from lines that also carry a UTC ``time=`` field.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._close_maps()
+        # Drop rows written by a build that died before saving meta.json.
+        for name, code in COLUMNS.items():
+            path = os.path.join(self.directory, f'{name}.bin')
+            if os.path.exists(path):
+                os.truncate(path, self.meta['rows'] * array(code).itemsize)
+        added = 0
+        for path in paths:
+            added += self._update_source(path, utc_offset)
+        self._save_meta()
+        return added
+
+    def _find_source(self, head):
+        for source in self.meta['sources']:
+            n = source['head_len']
+            if len(head) >= n and hashlib.sha1(head[:n]).hexdigest() == source['head']:
+                return source
+        return None
+
+    def _update_source(self, path, utc_offset=None):
+        head = _head(path)
+        if not head:
+            return 0
+        source = self._find_source(head)
+        if source is None:
+            source = {'head': '', 'head_len': 0, 'offset': 0}
+            self.meta['sources'].append(source)
+        if len(head) > source['head_len']:
+            source['head_len'] = len(head)
+            source['head'] = hashlib.sha1(head).hexdigest()
+        source['path'] = path
+
+        jsonl = '.jsonl' in path
+        tracker = None
+        if utc_offset is None and not jsonl:
+            utc_offset = source.get('utc_offset')
+            tracker = OffsetTracker(detect_utc_offset(path) if utc_offset is None else utc_offset)
+            utc_offset = tracker.utc_offset
+        buffers = {name: array(code) for name, code in COLUMNS.items()}
+        added = 0
+        with _open_binary(path) as f:
+            f.seek(source['offset'])
+            offset = source['offset']
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # partial line; pick it up next time
+                offset += len(raw)
+                line = raw.decode('utf-8', 'replace')
+                ts = self._add_line(line, jsonl, utc_offset, buffers)
+                if ts is not None:
+                    added += 1
+                    if tracker is not None and ts >= tracker.next_check:
+                        utc_offset = tracker.feed(line, ts)
+                    if len(buffers['ts']) >= _CHUNK_ROWS:
+                        self._append(buffers)
+            self._append(buffers)
+            source['offset'] = offset
+        if tracker is not None:
+            source['utc_offset'] = tracker.utc_offset
+        return added
+
+    def _string_id(self, value):
+        if value is None:
+            return 0
+        if not isinstance(value, int):
+            value = str(value)  # int user_ids stay ints in strings.json
+        sid = self._string_ids.get(value)
+        if sid is None:
+            sid = self._string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return sid
+
+    def _add_line(self, line, jsonl, utc_offset, buffers):
+        parsed = parse_json_line(line) if jsonl else parse_line(line, utc_offset)
+        if parsed is not None:
+            event, user_id, email, ip, ts = parsed
+            if event not in EVENTS:
+                return None
+            method = path = None
+            status = 0
+        else:
+            parsed = None if jsonl else parse_access_line(line, utc_offset)
+            if parsed is None:
+                return None
+            ip, method, path, status, ts = parsed
+            event, user_id, email = ACCESS, None, None
+        if ts < self.meta['last_ts']:
+            if ts.is_integer() and self.meta['last_ts'] - ts < 1:
+                # asctime is truncated to the second, so this line was written in the
+                # same second as the previous record, after it.
+                ts = self.meta['last_ts']
+            else:
+                self.meta['sorted'] = False
+        self.meta['last_ts'] = max(ts, self.meta['last_ts'])
+        buffers['ts'].append(ts)
+        buffers['event'].append(EVENTS.index(event))
+        buffers['user_id'].append(self._string_id(user_id))
+        buffers['email'].append(self._string_id(email))
+        buffers['ip'].append(self._string_id(ip))
+        buffers['method'].append(self._string_id(method))
+        buffers['path'].append(self._string_id(path))
+        buffers['status'].append(status)
+        return ts
+
+    def _append(self, buffers):
+        if not buffers['ts']:
+            return
+        for name, values in buffers.items():
+            with open(os.path.join(self.directory, f'{name}.bin'), 'ab') as f:
+                values.tofile(f)
+        self.meta['rows'] += len(buffers['ts'])
+        for values in buffers.values():
+            del values[:]
+
+    def _save_meta(self):
+        for name, data in (('strings.json', self.strings), ('meta.json', self.meta)):
+            path = os.path.join(self.directory, name)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(f'{path}.tmp', path)
+
+    # --- Reading ---
+    def _close_maps(self):
+        for view in (self._columns or {}).values():
+            view.release()
+        self._columns = None
+        for m in self._maps.values():
+            m.close()
+        self._maps = {}
+
+    def column(self, name):
+        if self._columns is None:
+            self._columns = {}
+        view = self._columns.get(name)
+        if view is None:
+            path = os.path.join(self.directory, f'{name}.bin')
+            if not os.path.exists(path) or not os.path.getsize(path):
+                view = memoryview(array(COLUMNS[name]))
+            else:
+                with open(path, 'rb') as f:
+                    self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(self._maps[name]).cast(COLUMNS[name])
+            self._columns[name] = view
+        return view
+
+    def _rows(self, event=None, since=None, until=None):
+        """Return ``(lo, hi, selector)`` for the matching rows; selector may be None."""
+        ts = self.column('ts')
+        lo, hi = 0, len(ts)
+        selector = None
+        if self.meta['sorted']:
+            if since is not None:
+                lo = bisect_left(ts, since)
+            if until is not None:
+                hi = bisect_left(ts, until)
+        else:
+            if since is not None:
+                selector = map(operator.ge, ts, repeat(since))
+            if until is not None:
+                before = map(operator.lt, ts, repeat(until))
+                selector = before if selector is None else map(operator.and_, selector, before)
+        if event is not None:
+            is_event = self._event_mask(event, lo, hi)
+            # Unsorted selectors always span the whole column, so they line up.
+            selector = is_event if selector is None else map(operator.and_, selector, is_event)
+        return lo, hi, selector
+
+    def _event_mask(self, event, lo, hi):
+        # One C-level translate instead of a Python comparison per row.
+        return self.column('event')[lo:hi].tobytes().translate(_EVENT_MASKS[EVENTS.index(event)])
+
+    def _values(self, name, lo, hi, selector):
+        values = self.column(name)[lo:hi]
+        return values if selector is None else compress(values, selector)
+
+    def decode(self, name, value):
+        if name in STRING_COLUMNS:
+            return self.strings[value]
+        if name == 'event':
+            return EVENTS[value]
+        return value
+
+    def count(self, event=None, since=None, until=None):
+        if event is not None and (self.meta['sorted'] or (since is None and until is None)):
+            # One byte per row: bytes.count() scans the event column at memory speed.
+            lo, hi, _ = self._rows(None, since, until)
+            return self.column('event')[lo:hi].tobytes().count(EVENTS.index(event))
+        lo, hi, selector = self._rows(event, since, until)
+        return hi - lo if selector is None else sum(selector)
+
+    def group_by(self, key, event=None, since=None, until=None):
+        lo, hi, selector = self._rows(event, since, until)
+        counts = Counter(self._values(key, lo, hi, selector))
+        return Counter({self.decode(key, k): v for k, v in counts.items()})
+
+    def bins(self, width, key=None, event=None, since=None, until=None):
+        """Counts per ``width``-second bin (and per ``key`` value if given)."""
+        if self.meta['sorted']:
+            return self._sorted_bins(width, key, event, since, until)
+        lo, hi, selector = self._rows(event, since, until)
+        # Filter each column before binning so only matching rows are hashed.
+        if selector is None:
+            ts_selector = key_selector = None
+        elif key is None:
+            ts_selector, key_selector = selector, None
+        else:
+            ts_selector, key_selector = tee(selector)
+        starts = map(operator.floordiv, self._values('ts', lo, hi, ts_selector), repeat(width))
+        if key is not None:
+            starts = zip(starts, self._values(key, lo, hi, key_selector))
+        counts = Counter(starts)
+        if key is None:
+            return {k * width: v for k, v in counts.items()}
+        return {(b * width, self.decode(key, k)): v for (b, k), v in counts.items()}
+
+    def _sorted_bins(self, width, key, event, since, until):
+        # Bin edges are found by bisecting the timestamps, so rows are never
+        # binned one by one: plain counts are slice lengths (or a bytes.count()
+        # of the event column) and only ``key`` values are hashed.
+        lo, hi, _ = self._rows(None, since, until)
+        ts = self.column('ts')
+        events = self.column('event')
+        code = None if event is None else EVENTS.index(event)
+        counts = {}
+        while lo < hi:
+            start = ts[lo] // width * width
+            end = bisect_left(ts, start + width, lo, hi)
+            if key is None:
+                n = end - lo if code is None else events[lo:end].tobytes().count(code)
+                if n:
+                    counts[start] = n
+            else:
+                selector = None if code is None else self._event_mask(event, lo, end)
+                for k, n in Counter(self._values(key, lo, end, selector)).items():
+                    counts[start, self.decode(key, k)] = n
+            lo = end
+        return counts
+
+    def records(self, event=None, since=None, until=None):
+        """Yield rows as clean dicts (ANSI codes and query strings already stripped)."""
+        lo, hi, selector = self._rows(event, since, until)
+        rows = range(lo, hi) if selector is None else compress(range(lo, hi), selector)
+        columns = {name: self.column(name) for name in COLUMNS}
+        for i in rows:
+            record = {
+                'time': datetime.fromtimestamp(columns['ts'][i], timezone.utc).isoformat(),
+                'event': EVENTS[columns['event'][i]],
+            }
+            for name in ('user_id', 'email', 'ip', 'method', 'path', 'status'):
+                value = self.decode(name, columns[name][i])
+                if value is not None and (value or name != 'status'):
+                    record[name] = value
+            yield record
+
+
+# --- CLI ---
+_DURATION = re.compile(r'^(\d+(?:\.\d+)?)([smhd]?)$')
+_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(text):
+    match = _DURATION.match(text)
+    if match is None:
+        raise argparse.ArgumentTypeError(f'bad duration {text!r} (expected e.g. 90s, 15m, 7d)')
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def parse_time(text):
+    """ISO timestamp, or a duration meaning "that long ago" (like KQL ``ago()``)."""
+    try:
+        return time.time() - parse_duration(text)
+    except argparse.ArgumentTypeError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'bad time {text!r} (expected ISO time or e.g. 7d)') from None
+
+
+def parse_offset(text):
+    try:
+        return parse_tz(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def _format_ts(ts):
+    return datetime.fromtimestamp(ts).isoformat(sep=' ', timespec='seconds')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query a columnar index over app.log history.')
+    parser.add_argument('--index', help='index directory (default: <log>.idx)')
+    parser.add_argument('--log', default='app.log', help='log file; rotated .N / .N.gz archives are picked up')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='index lines appended since the last build')
+    build.add_argument('--tz', type=parse_offset,
+                       help="UTC offset of the log's asctime, e.g. -04:00 "
+                            '(default: learned from time= fields)')
+    queries = {
+        'count': 'number of matching records',
+        'top': 'record counts grouped by a column',
+        'bins': 'record counts per time bin (optionally per column value)',
+        'export': 'matching records as JSON lines',
+    }
+    for name, help_text in queries.items():
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('--event', choices=EVENTS)
+        p.add_argument('--since', type=parse_time, help='ISO time or duration ago, e.g. 7d')
+        p.add_argument('--until', type=parse_time)
+        if name in ('top', 'bins'):
+            p.add_argument('--by', choices=[c for c in COLUMNS if c not in ('ts', 'status')] + ['status'],
+                           default='ip' if name == 'top' else None)
+        if name == 'top':
+            p.add_argument('-n', type=int, default=20)
+        if name == 'bins':
+            p.add_argument('--bin', type=parse_duration, default=900.0, help='bin width (default 15m)')
+            p.add_argument('--having', type=int, default=0, help='only show bins with more records than this')
+    args = parser.parse_args(argv)
+
+    index = LogIndex(args.index or f'{args.log}.idx')
+    if args.command == 'build':
+        started = time.perf_counter()
+        added = index.update(discover(args.log), args.tz)
+        print(f'indexed {added} new records ({index.meta["rows"]} total) '
+              f'in {(time.perf_counter() - started) * 1e3:.1f} ms', file=sys.stderr)
+        return 0
+
+    where = {'event': args.event, 'since': args.since, 'until': args.until}
+    if args.command == 'count':
+        print(index.count(**where))
+    elif args.command == 'top':
+        for value, n in index.group_by(args.by, **where).most_common(args.n):
+            print(f'{n}\t{value}')
+    elif args.command == 'bins':
+        counts = index.bins(args.bin, args.by, **where)
+        for key, n in sorted(counts.items(), key=lambda item: str(item[0])):
+            if n <= args.having:
+                continue
+            if args.by is None:
+                print(f'{_format_ts(key)}\t{n}')
+            else:
+                print(f'{_format_ts(key[0])}\t{key[1]}\t{n}')
+    else:
+        out = sys.stdout
+        for record in index.records(**where):
+            out.write(json.dumps(record) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,212 @@
+import gzip
+import json
+import re
+from datetime import datetime, timezone
+
+from event_log import LOGIN, LOGIN_FAILED, LOGIN_THROTTLED, LOGOUT, PROTECTED, UNAUTHORIZED
+
+# werkzeug access lines: IP - - [date] "METHOD /path HTTP/1.1" status -
+ACCESS = 'access'
+_ACCESS = re.compile(r'^(\S+) - - \[[^\]]*\] "(\S+) (\S+) [^"]*" (\d{3})')
+_ANSI = re.compile(r'\x1b\[[0-9;]*m')
+TIME_FIELD = ' | time='
+_TZ = re.compile(r'^([+-])(\d{1,2})(?::?(\d{2}))?$')
+
+# Message prefixes written by app7.py (and the older app5.py wording).
+_MESSAGES = (
+    ('Accessed /protected', PROTECTED),
+    ('Login |', LOGIN),
+    ('Login successful', LOGIN),
+    ('Failed login attempt', LOGIN_FAILED),
+    ('Throttled login attempt', LOGIN_THROTTLED),
+    ('Logout |', LOGOUT),
+    ('User logged out', LOGOUT),
+    ('Unauthorized access attempt', UNAUTHORIZED),
+)
+
+
+def open_log(path):
+    """Open a log file for reading, transparently handling gzipped archives."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def parse_tz(text):
+    """``UTC``, ``+04:00``, ``-0400`` or ``-4`` as an offset east of UTC in seconds."""
+    if text.upper() in ('UTC', 'Z'):
+        return 0
+    match = _TZ.match(text)
+    if match is None:
+        raise ValueError(f'bad UTC offset {text!r} (expected e.g. UTC, +02:00, -4)')
+    sign, hours, minutes = match.groups()
+    seconds = int(hours) * 3600 + int(minutes or 0) * 60
+    return -seconds if sign == '-' else seconds
+
+
+def _utc(value):
+    # time= fields are UTC; older app versions wrote them without an offset.
+    stamp = datetime.fromisoformat(value)
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc)
+    return stamp.timestamp()
+
+
+def _asctime(head, utc_offset):
+    text = head[head.index(']') + 2:]
+    if utc_offset is None:
+        return datetime.fromisoformat(text).timestamp()  # writer's zone unknown; assume ours
+    # Appending the offset is much cheaper than datetime.replace(tzinfo=...).
+    return datetime.fromisoformat(text + '+00:00').timestamp() - utc_offset
+
+
+def _fields(message):
+    fields = {}
+    for field in message.rstrip('\n').split(' | ')[1:]:
+        name, _, value = field.partition('=')
+        fields[name] = value
+    return fields
+
+
+def line_utc_offset(line):
+    """The writer's UTC offset in seconds, for lines carrying both asctime and ``time=``.
+
+    asctime is the writer's local time to the second, so the difference is
+    rounded to whole quarter hours. Returns ``None`` for other lines.
+    """
+    head, sep, message = line.partition(' | ')
+    if not sep or not head.startswith('[') or TIME_FIELD not in message:
+        return None
+    try:
+        diff = _asctime(head, 0) - _utc(_fields(message)['time'])
+    except (ValueError, KeyError):
+        return None
+    return round(diff / 900) * 900
+
+
+class OffsetTracker:
+    """Follows the writer's UTC offset through a log, e.g. across DST changes.
+
+    Offsets only change on quarter-hour boundaries, so callers hand it a
+    parsed line only once its timestamp reaches ``next_check``; every other
+    line costs a float comparison instead of a second parse.
+    """
+
+    def __init__(self, utc_offset=None):
+        self.utc_offset = utc_offset
+        self.next_check = float('-inf')
+
+    def feed(self, line, ts):
+        if TIME_FIELD in line:
+            offset = line_utc_offset(line)
+            if offset is not None:
+                self.utc_offset = offset
+                self.next_check = (ts // 900 + 1) * 900
+        return self.utc_offset
+
+
+def detect_utc_offset(path):
+    """The writer's UTC offset from the first line of ``path`` that reveals it, else ``None``."""
+    with open_log(path) as f:
+        for line in f:
+            offset = line_utc_offset(line)
+            if offset is not None:
+                return offset
+    return None
+
+
+def parse_line(line, utc_offset=None):
+    """Parse one app.log line into ``(event, user_id, email, ip, ts)``.
+
+    ``ts`` is a POSIX timestamp. Lines without a ``time=`` field fall back to
+    the asctime head, read as local time ``utc_offset`` seconds east of UTC
+    (the reader's own zone if ``None``). Lines that are not handler events
+    (werkzeug access lines, reloader noise) return ``None``.
+    """
+    head, sep, message = line.partition(' | ')
+    if not sep or not head.startswith('['):
+        return None
+    for prefix, event in _MESSAGES:
+        if message.startswith(prefix):
+            break
+    else:
+        return None
+
+    user_id = email = ip = when = None
+    for field in message.rstrip('\n').split(' | ')[1:]:
+        name, _, value = field.partition('=')
+        if name == 'user_id':
+            user_id = int(value) if value.isdigit() else value
+        elif name == 'email':
+            email = None if value in ('', 'None') else value
+        elif name == 'IP':
+            ip = value
+        elif name == 'time':
+            when = value
+
+    try:
+        ts = _asctime(head, utc_offset) if when is None else _utc(when)
+    except ValueError:
+        return None
+    return event, user_id, email, ip, ts
+
+
+def strip_ansi(text):
+    return _ANSI.sub('', text) if '\x1b' in text else text
+
+
+def parse_access_line(line, utc_offset=None):
+    """Parse a werkzeug access line into ``(ip, method, path, status, ts)``.
+
+    Color codes and query strings are dropped; ``ts`` comes from the asctime
+    head as in ``parse_line``. Returns ``None`` for other lines.
+    """
+    head, sep, message = line.partition(' | ')
+    if not sep or not head.startswith('['):
+        return None
+    match = _ACCESS.match(strip_ansi(message))
+    if match is None:
+        return None
+    ip, method, path, status = match.groups()
+    try:
+        ts = _asctime(head, utc_offset)
+    except ValueError:
+        return None
+    return ip, method, path.partition('?')[0], int(status), ts
+
+
+def parse_json_line(line):
+    """Parse one requests.jsonl record into ``(event, user_id, email, ip, ts)``."""
+    try:
+        record = json.loads(line)
+        ts = datetime.fromisoformat(record['time']).timestamp()
+    except (ValueError, KeyError, TypeError):
+        return None
+    return record.get('event'), record.get('user_id'), record.get('email'), record.get('ip'), ts
+
+
+def iter_events(path, utc_offset=None):
+    """Yield parsed events from an app.log or requests.jsonl file.
+
+    Unless ``utc_offset`` is given, asctime-only lines are read in the
+    writer's zone, learned from lines that carry both timestamps (and
+    followed as it changes, e.g. across DST).
+    """
+    if '.jsonl' in path:
+        with open_log(path) as f:
+            for line in f:
+                event = parse_json_line(line)
+                if event is not None:
+                    yield event
+        return
+    tracker = None
+    if utc_offset is None:
+        tracker = OffsetTracker(detect_utc_offset(path))
+        utc_offset = tracker.utc_offset
+    with open_log(path) as f:
+        for line in f:
+            event = parse_line(line, utc_offset)
+            if event is not None:
+                if tracker is not None and event[4] >= tracker.next_check:
+                    utc_offset = tracker.feed(line, event[4])
+                yield event
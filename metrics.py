@@ -0,0 +1,202 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from threading import get_native_id
+
+from flask import Response, request
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _new_shard():
+    # counters: (route, method, status) -> n
+    # latency: (route, method) -> [count per bucket..., +Inf count, sum]
+    # events: event -> n
+    return {'requests': {}, 'latency': {}, 'events': {}}
+
+
+def _merge(into, shard):
+    for name in ('requests', 'events'):
+        target = into[name]
+        for key, value in shard[name].copy().items():
+            target[key] = target.get(key, 0) + value
+    target = into['latency']
+    for key, values in shard['latency'].copy().items():
+        current = target.get(key)
+        target[key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+    return into
+
+
+class Metrics:
+    """Per-route request metrics spread over a fixed set of shards.
+
+    Each thread updates the shard picked by its OS thread id, behind that
+    shard's own lock, so concurrent requests rarely contend and short-lived
+    connection threads (werkzeug starts one per client connection) cost
+    nothing extra. With ``directory`` set, every process periodically writes
+    its totals there and ``/metrics`` merges all of them, which is how
+    serve.py workers report as one.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0, shards=16):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.shard_count = shards
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        # Checked lazily on use: a forked worker starts with empty shards, fresh
+        # locks and its own flusher thread.
+        self._shards = [(_new_shard(), threading.Lock()) for _ in range(self.shard_count)]
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _start_flusher(self):
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                self._flusher.start()
+
+    # --- Hot path ---
+    def observe_request(self, route, method, status, seconds):
+        if self._pid != os.getpid():
+            self._reset()
+        if self.directory and self._flusher is None:
+            self._start_flusher()
+        shard, lock = self._shards[get_native_id() % self.shard_count]
+        with lock:
+            requests = shard['requests']
+            key = (route, method, status)
+            requests[key] = requests.get(key, 0) + 1
+            latency = shard['latency']
+            key = (route, method)
+            values = latency.get(key)
+            if values is None:
+                values = latency[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            values[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            values[-1] += seconds
+
+    def count_event(self, event):
+        if self._pid != os.getpid():
+            self._reset()
+        shard, lock = self._shards[get_native_id() % self.shard_count]
+        with lock:
+            events = shard['events']
+            events[event] = events.get(event, 0) + 1
+
+    # --- Aggregation ---
+    def snapshot(self):
+        if self._pid != os.getpid():
+            self._reset()
+        total = _new_shard()
+        for shard, lock in self._shards:
+            with lock:
+                _merge(total, shard)
+        return total
+
+    def _path(self, pid=None):
+        return os.path.join(self.directory, f'metrics-{pid or os.getpid()}.json')
+
+    def flush(self):
+        snapshot = self.snapshot()
+        data = {
+            'requests': [[*key, value] for key, value in snapshot['requests'].items()],
+            'latency': [[*key, values] for key, values in snapshot['latency'].items()],
+            'events': snapshot['events'],
+        }
+        path = self._path()
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect(self):
+        """Totals for this process plus whatever other workers last flushed."""
+        total = self.snapshot()
+        if not self.directory:
+            return total
+        own = self._path()
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            _merge(total, {
+                'requests': {tuple(row[:3]): row[3] for row in data['requests']},
+                'latency': {tuple(row[:2]): row[2] for row in data['latency']},
+                'events': data['events'],
+            })
+        return total
+
+    def render(self):
+        """Prometheus text exposition format."""
+        total = self.collect()
+        lines = [
+            '# HELP app_requests_total HTTP requests by route, method and status.',
+            '# TYPE app_requests_total counter',
+        ]
+        for (route, method, status), value in sorted(total['requests'].items()):
+            lines.append(f'app_requests_total{{route="{route}",method="{method}",status="{status}"}} {value}')
+
+        lines += [
+            '# HELP app_request_duration_seconds Request latency by route and method.',
+            '# TYPE app_request_duration_seconds histogram',
+        ]
+        for (route, method), values in sorted(total['latency'].items()):
+            labels = f'route="{route}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'app_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'app_request_duration_seconds_sum{{{labels}}} {values[-1]:.6f}')
+            lines.append(f'app_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        lines += [
+            '# HELP app_events_total Login, logout and access events logged by the handlers.',
+            '# TYPE app_events_total counter',
+        ]
+        for event, value in sorted(total['events'].items()):
+            lines.append(f'app_events_total{{event="{event}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    # --- Flask wiring ---
+    def init_app(self, app):
+        perf_counter = time.perf_counter
+
+        # Resolve the request proxy once per hook; every proxied attribute
+        # access costs about as much as the metrics update itself.
+        @app.before_request
+        def _start_timer():
+            request._get_current_object()._metrics_started = perf_counter()
+
+        @app.after_request
+        def _record(response):
+            req = request._get_current_object()
+            started = getattr(req, '_metrics_started', None)
+            if started is not None:
+                rule = req.url_rule
+                self.observe_request(rule.rule if rule is not None else 'unmatched',
+                                     req.method, response.status_code, perf_counter() - started)
+            return response
+
+        @app.route('/metrics')
+        def metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+        app.extensions['metrics'] = self
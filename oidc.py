@@ -0,0 +1,252 @@
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from authlib.jose import JsonWebKey, JsonWebToken
+from authlib.jose.errors import JoseError
+
+from user_store import LRUCache
+
+_MAX_AGE = re.compile(r'(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*"?(\d+)', re.I)
+# Claims copied from the ID token when userinfo has not been fetched yet.
+PROFILE_CLAIMS = ('sub', 'name', 'nickname', 'given_name', 'family_name', 'picture', 'email', 'email_verified')
+
+
+class OIDCError(Exception):
+    pass
+
+
+def issuer_from_domain(domain):
+    """``AUTH0_DOMAIN`` as an issuer URL; full URLs (e.g. a local stub IdP) are kept."""
+    if '://' not in domain:
+        domain = f'https://{domain}'
+    return domain.rstrip('/') + '/'
+
+
+def cache_ttl(headers, default):
+    """Seconds a response may be cached for, from its Cache-Control header."""
+    value = headers.get('Cache-Control') or ''
+    if 'no-store' in value or 'no-cache' in value:
+        return 0
+    match = _MAX_AGE.search(value)
+    return int(match.group(1)) if match else default
+
+
+def fetch_json(url, timeout, data=None, headers=None):
+    """GET (or POST ``data`` as a form) and return ``(body, response headers)``."""
+    if data is not None:
+        data = urllib.parse.urlencode(data).encode()
+    req = urllib.request.Request(url, data=data, headers={'Accept': 'application/json', **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.load(resp), resp.headers
+    except urllib.error.HTTPError as e:
+        raise OIDCError(f'{url}: HTTP {e.code}') from e
+    except (OSError, ValueError) as e:
+        raise OIDCError(f'{url}: {e}') from e
+
+
+class ProviderCache:
+    """Discovery document and JWKS for one issuer, kept fresh off the request path.
+
+    A background thread refetches both shortly before the Cache-Control
+    max-age runs out (clamped to ``[min_ttl, max_ttl]``); on failure the old
+    keys stay in use and it retries. An unknown ``kid`` forces a refetch at
+    most once per ``refetch_interval`` so forged tokens cannot hammer the IdP.
+    """
+
+    def __init__(self, issuer, timeout=5.0, default_ttl=3600, min_ttl=60, max_ttl=86400,
+                 refetch_interval=10.0):
+        self.issuer = issuer
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.refetch_interval = refetch_interval
+        self.metadata = None
+        self._keys = None
+        self._expires = 0.0
+        self._last_forced = float('-inf')
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        # Locks held by another thread at fork time would stay locked in the child.
+        self._lock = threading.Lock()
+        self._refetch_lock = threading.Lock()
+        self._locks_pid = os.getpid()
+
+    def start(self):
+        """Start the background refresh thread for this process."""
+        # Threads do not survive fork; each worker starts its own refresher.
+        if self._locks_pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='oidc-refresh', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                delay = max(self._expires - time.monotonic(), 0) * 0.8
+            except OIDCError:
+                delay = min(self.min_ttl, 30)
+            time.sleep(max(delay, 1.0))
+
+    def refresh(self):
+        metadata, headers = fetch_json(self.issuer + '.well-known/openid-configuration', self.timeout)
+        ttl = cache_ttl(headers, self.default_ttl)
+        if not isinstance(metadata, dict) or not isinstance(metadata.get('jwks_uri'), str):
+            raise OIDCError(f'{self.issuer} does not advertise jwks_uri')
+        jwks, headers = fetch_json(metadata['jwks_uri'], self.timeout)
+        ttl = min(ttl, cache_ttl(headers, self.default_ttl))
+        try:
+            keys = JsonWebKey.import_key_set(jwks)
+        except (JoseError, ValueError, TypeError, KeyError) as e:
+            raise OIDCError(f"{metadata['jwks_uri']}: bad JWKS: {e}") from e
+        with self._lock:
+            self.metadata = metadata
+            self._keys = keys
+            self._expires = time.monotonic() + min(max(ttl, self.min_ttl), self.max_ttl)
+
+    def _loaded(self):
+        if self._pid != os.getpid():
+            self.start()
+        if self._keys is None:
+            self.refresh()
+
+    def get(self, name):
+        self._loaded()
+        try:
+            return self.metadata[name]
+        except KeyError:
+            raise OIDCError(f'{self.issuer} does not advertise {name}') from None
+
+    def find_key(self, kid):
+        self._loaded()
+        try:
+            return self._keys.find_by_kid(kid)
+        except ValueError:
+            pass
+        # Keys were probably rotated; fetch them now instead of waiting for max-age.
+        with self._refetch_lock:
+            try:
+                return self._keys.find_by_kid(kid)  # another request just refetched
+            except ValueError:
+                pass
+            if time.monotonic() - self._last_forced >= self.refetch_interval:
+                self._last_forced = time.monotonic()
+                self.refresh()
+                try:
+                    return self._keys.find_by_kid(kid)
+                except ValueError:
+                    pass
+        raise OIDCError(f'unknown signing key {kid!r}')
+
+
+class OIDCClient:
+    """Authorization-code login against an OIDC provider such as Auth0.
+
+    ID tokens are verified locally against the cached JWKS. Userinfo is
+    cached per ``sub`` for ``userinfo_ttl`` seconds and refreshed in the
+    background, so a callback only waits on the token exchange itself; until
+    the first userinfo response arrives the profile claims of the ID token
+    are used.
+    """
+
+    def __init__(self, issuer, client_id, client_secret, redirect_uri, scope='openid profile email',
+                 userinfo_ttl=300, timeout=5.0, leeway=60, algorithms=('RS256',), cache_size=4096):
+        self.provider = ProviderCache(issuer, timeout)
+        self.issuer = issuer
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.scope = scope
+        self.userinfo_ttl = userinfo_ttl
+        self.timeout = timeout
+        self.leeway = leeway
+        self._jwt = JsonWebToken(list(algorithms))
+        self._userinfo = LRUCache(cache_size)
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    def authorize_url(self, state, nonce):
+        params = {
+            'response_type': 'code',
+            'client_id': self.client_id,
+            'redirect_uri': self.redirect_uri,
+            'scope': self.scope,
+            'state': state,
+            'nonce': nonce,
+        }
+        return f"{self.provider.get('authorization_endpoint')}?{urllib.parse.urlencode(params)}"
+
+    def fetch_token(self, code):
+        token, _ = fetch_json(self.provider.get('token_endpoint'), self.timeout, data={
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': self.redirect_uri,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
+        if 'id_token' not in token:
+            raise OIDCError('token response has no id_token')
+        return token
+
+    def verify_id_token(self, id_token, nonce):
+        try:
+            claims = self._jwt.decode(
+                id_token,
+                lambda header, payload: self.provider.find_key(header.get('kid')),
+                claims_options={
+                    'iss': {'essential': True, 'value': self.issuer},
+                    'aud': {'essential': True, 'value': self.client_id},
+                    'sub': {'essential': True},
+                    'exp': {'essential': True},
+                    'iat': {'essential': True},
+                    'nonce': {'essential': True, 'value': nonce},
+                },
+            )
+            claims.validate(leeway=self.leeway)
+        except JoseError as e:
+            raise OIDCError(f'invalid id_token: {e}') from e
+        return dict(claims)
+
+    def userinfo(self, claims, access_token=None):
+        sub = claims['sub']
+        cached = self._userinfo.get(sub)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        if access_token:
+            self._refresh_userinfo(sub, access_token)
+        if cached is not None:
+            return cached[0]
+        return {name: claims[name] for name in PROFILE_CLAIMS if name in claims}
+
+    def _refresh_userinfo(self, sub, access_token):
+        with self._refreshing_lock:
+            if sub in self._refreshing:
+                return
+            self._refreshing.add(sub)
+
+        def fetch():
+            try:
+                info, _ = fetch_json(self.provider.get('userinfo_endpoint'), self.timeout,
+                                     headers={'Authorization': f'Bearer {access_token}'})
+                if info.get('sub') == sub:
+                    self._userinfo.set(sub, (info, time.monotonic() + self.userinfo_ttl))
+            except OIDCError:
+                pass
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(sub)
+
+        threading.Thread(target=fetch, name='oidc-userinfo', daemon=True).start()
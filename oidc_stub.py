@@ -0,0 +1,171 @@
+import argparse
+import json
+import secrets
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from authlib.jose import JsonWebKey, jwt
+
+
+class StubIdP:
+    """Just enough of an OIDC provider to log in against locally.
+
+    ``/authorize`` signs in immediately as ``login_hint`` (default
+    admin@example.com) and redirects back with a code. ``POST /rotate``
+    replaces the signing key, ``GET /stats`` returns request counts per path,
+    and ``delay`` makes every response that slow.
+    """
+
+    def __init__(self, issuer, client_id, client_secret, delay=0.0, jwks_max_age=300):
+        self.issuer = issuer
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.delay = delay
+        self.jwks_max_age = jwks_max_age
+        self.hits = Counter()
+        self._codes = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self.rotate()
+
+    def rotate(self):
+        self.key = JsonWebKey.generate_key('RSA', 2048, {'kid': secrets.token_hex(8)}, is_private=True)
+        return self.key.kid
+
+    def claims(self, email):
+        return {
+            'sub': f'stub|{email}',
+            'email': email,
+            'email_verified': True,
+            'name': email.split('@')[0].replace('.', ' ').title(),
+        }
+
+    def metadata(self):
+        return {
+            'issuer': self.issuer,
+            'authorization_endpoint': self.issuer + 'authorize',
+            'token_endpoint': self.issuer + 'oauth/token',
+            'userinfo_endpoint': self.issuer + 'userinfo',
+            'jwks_uri': self.issuer + '.well-known/jwks.json',
+            'response_types_supported': ['code'],
+            'subject_types_supported': ['public'],
+            'id_token_signing_alg_values_supported': ['RS256'],
+        }
+
+    def authorize(self, params):
+        code = secrets.token_urlsafe(24)
+        with self._lock:
+            self._codes[code] = (params.get('login_hint', 'admin@example.com'), params.get('nonce'),
+                                 params.get('redirect_uri'))
+        query = urllib.parse.urlencode({'code': code, 'state': params.get('state', '')})
+        return f"{params['redirect_uri']}?{query}"
+
+    def token(self, form):
+        if (form.get('client_id'), form.get('client_secret')) != (self.client_id, self.client_secret):
+            return 401, {'error': 'invalid_client'}
+        with self._lock:
+            grant = self._codes.pop(form.get('code'), None)
+        if grant is None or grant[2] != form.get('redirect_uri'):
+            return 400, {'error': 'invalid_grant'}
+        email, nonce, _ = grant
+        now = int(time.time())
+        claims = {**self.claims(email), 'iss': self.issuer, 'aud': self.client_id, 'iat': now, 'exp': now + 3600}
+        if nonce:
+            claims['nonce'] = nonce
+        id_token = jwt.encode({'alg': 'RS256', 'kid': self.key.kid}, claims, self.key).decode()
+        access_token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._tokens[access_token] = email
+        return 200, {'access_token': access_token, 'id_token': id_token, 'token_type': 'Bearer', 'expires_in': 3600}
+
+    def userinfo(self, authorization):
+        with self._lock:
+            email = self._tokens.get(authorization.removeprefix('Bearer '))
+        if email is None:
+            return 401, {'error': 'invalid_token'}
+        return 200, self.claims(email)
+
+
+def make_handler(idp):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _start(self):
+            url = urllib.parse.urlsplit(self.path)
+            with idp._lock:
+                idp.hits[url.path] += 1
+            if idp.delay and url.path != '/stats':
+                time.sleep(idp.delay)
+            return url.path, dict(urllib.parse.parse_qsl(url.query))
+
+        def do_GET(self):
+            path, params = self._start()
+            if path == '/.well-known/openid-configuration':
+                self._send(200, idp.metadata(), {'Cache-Control': 'public, max-age=3600'})
+            elif path == '/.well-known/jwks.json':
+                self._send(200, {'keys': [idp.key.as_dict()]},
+                           {'Cache-Control': f'public, max-age={idp.jwks_max_age}'})
+            elif path == '/authorize':
+                self.send_response(302)
+                self.send_header('Location', idp.authorize(params))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif path == '/userinfo':
+                self._send(*idp.userinfo(self.headers.get('Authorization', '')))
+            elif path == '/stats':
+                with idp._lock:
+                    self._send(200, dict(idp.hits))
+            else:
+                self._send(404, {'error': 'not_found'})
+
+        def do_POST(self):
+            path, _ = self._start()
+            length = int(self.headers.get('Content-Length') or 0)
+            form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+            if path == '/oauth/token':
+                self._send(*idp.token(form))
+            elif path == '/rotate':
+                self._send(200, {'kid': idp.rotate()})
+            else:
+                self._send(404, {'error': 'not_found'})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a local stand-in OIDC provider for testing Auth0 login.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--client-id', default='stub-client')
+    parser.add_argument('--client-secret', default='stub-secret')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jwks-max-age', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    issuer = f'http://127.0.0.1:{args.port}/'
+    idp = StubIdP(issuer, args.client_id, args.client_secret, args.delay, args.jwks_max_age)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(idp))
+    print(f'stub IdP at {issuer} (AUTH0_DOMAIN={issuer} AUTH0_CLIENT_ID={args.client_id} '
+          f'AUTH0_CLIENT_SECRET={args.client_secret})', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
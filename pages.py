@@ -0,0 +1,57 @@
+import gzip
+import hashlib
+
+from flask import Response
+from markupsafe import Markup, escape
+
+_SLOT = '\x00'
+
+
+class Fragments:
+    """A template rendered once at startup with placeholder slots.
+
+    The static HTML between the slots is kept as plain strings, so a request
+    only escapes and joins its own values instead of running the template.
+    """
+
+    def __init__(self, template, *fields, **context):
+        slots = {name: Markup(f'{_SLOT}{name}{_SLOT}') for name in fields}
+        parts = template.render(**context, **slots).split(_SLOT)
+        self._static = parts[0::2]
+        self._fields = parts[1::2]
+
+    def render(self, **values):
+        static = self._static
+        out = [static[0]]
+        for i, name in enumerate(self._fields, 1):
+            out.append(escape(values[name]))
+            out.append(static[i])
+        return ''.join(out)
+
+
+class StaticPage:
+    """A fully static page served with an ETag and a precompressed gzip body."""
+
+    def __init__(self, template, mimetype='text/html', **context):
+        self.body = template.render(**context).encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        # Each encoding is a separate representation with its own strong ETag.
+        self.gzip_etag = self.etag + '-gz'
+        self.mimetype = mimetype
+
+    def response(self, request):
+        use_gzip = bool(request.accept_encodings['gzip'])
+        etag = self.gzip_etag if use_gzip else self.etag
+        # If-None-Match uses weak comparison (RFC 9110), so W/"<etag>" matches too.
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        elif use_gzip:
+            response = Response(self.gzip_body, mimetype=self.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(self.body, mimetype=self.mimetype)
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,205 @@
+import contextlib
+import fcntl
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+
+class MemoryBackend:
+    """Token buckets in ``shards`` dicts, each behind its own lock.
+
+    Per-process only. Each shard keeps at most ``max_keys`` buckets; the
+    oldest inserted key is dropped first.
+    """
+
+    def __init__(self, shards=64, max_keys=16384):
+        self.max_keys = max_keys
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def take(self, key, capacity, rate, now):
+        """Take one token from ``key``; return 0.0 or the seconds until one is available."""
+        buckets, lock = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= self.max_keys:
+                    del buckets[next(iter(buckets))]
+                buckets[key] = [capacity - 1.0, now]
+                return 0.0
+            tokens = min(capacity, bucket[0] + max(0.0, now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return 0.0
+            bucket[0] = tokens
+            return (1.0 - tokens) / rate
+
+
+class SharedMemoryBackend:
+    """Token buckets in a memory-mapped file shared by every worker process.
+
+    The file holds ``slots`` fixed 24-byte records (key fingerprint, tokens,
+    last update) split into shards. A shard is guarded by a ``threading.Lock``
+    (``fcntl`` record locks are per process, so they do not exclude threads
+    of the same worker) plus an ``fcntl`` byte-range lock for the other
+    processes. Keys probe a few slots; when all are taken by other keys the
+    least recently updated one is reused, so memory never grows.
+    """
+
+    _SLOT = struct.Struct('<Qdd')
+    _PROBES = 4
+
+    def __init__(self, path='/dev/shm/app7-rate-limit', slots=65536, shards=256):
+        self.path = path
+        self.slots = slots
+        self.shards = shards
+        self._per_shard = slots // shards
+        size = self._per_shard * shards * self._SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._located = {}
+        self._locks_pid = None
+
+    def _reset_locks(self):
+        # A lock held by another thread at fork time would stay locked in the child.
+        self._locks = [threading.Lock() for _ in range(self.shards)]
+        self._locks_pid = os.getpid()
+
+    def _locate(self, key):
+        data = key.encode()
+        fingerprint = (zlib.crc32(data) << 32 | zlib.adler32(data)) or 1
+        shard, start = divmod(fingerprint % (self._per_shard * self.shards), self._per_shard)
+        located = self._located
+        if len(located) >= 65536:
+            located.clear()
+        located[key] = found = (fingerprint, shard, start)
+        return found
+
+    def take(self, key, capacity, rate, now):
+        fingerprint, shard, start = self._located.get(key) or self._locate(key)
+        per_shard = self._per_shard
+        base = shard * per_shard
+        slot = self._SLOT
+        slot_size = slot.size
+        lock_len, lock_start = per_shard * slot_size, base * slot_size
+        if self._locks_pid != os.getpid():
+            self._reset_locks()
+        with self._locks[shard]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, lock_len, lock_start)
+            try:
+                target = None
+                oldest = None
+                for i in range(self._PROBES):
+                    offset = (base + (start + i) % per_shard) * slot_size
+                    fp, tokens, last = slot.unpack_from(self._map, offset)
+                    if fp == fingerprint:
+                        target = offset
+                        break
+                    if fp == 0:
+                        # Slots are never emptied, so the key cannot be further along.
+                        oldest = (offset, 0.0)
+                        break
+                    if oldest is None or last < oldest[1]:
+                        oldest = (offset, last)
+                if target is None:
+                    slot.pack_into(self._map, oldest[0], fingerprint, capacity - 1.0, now)
+                    return 0.0
+                tokens += (now - last) * rate if now > last else 0.0
+                if tokens > capacity:
+                    tokens = capacity
+                if tokens >= 1.0:
+                    slot.pack_into(self._map, target, fingerprint, tokens - 1.0, now)
+                    return 0.0
+                slot.pack_into(self._map, target, fingerprint, tokens, now)
+                return (1.0 - tokens) / rate
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, lock_len, lock_start)
+
+
+class SQLiteBackend:
+    """Token buckets in a SQLite table shared by every process on the host.
+
+    Much slower than ``SharedMemoryBackend`` but needs no ``/dev/shm``.
+    Every ``prune_every`` takes, buckets that have refilled completely (and
+    so behave exactly like missing ones) are deleted, keeping the table to
+    recently active keys.
+    """
+
+    def __init__(self, path='rate_limit.db', prune_every=1000):
+        self.path = path
+        self.prune_every = prune_every
+        self._takes = 0
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, last REAL)')
+        with contextlib.suppress(sqlite3.OperationalError):
+            # ``full_at``: when the bucket is back at capacity.
+            conn.execute('ALTER TABLE buckets ADD COLUMN full_at REAL')
+        conn.execute('CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)')
+
+    def _connect(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            local.conn.execute('PRAGMA journal_mode=WAL')
+            local.pid = os.getpid()
+        return local.conn
+
+    def take(self, key, capacity, rate, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, last FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1.0 else (1.0 - tokens) / rate
+            if not wait:
+                tokens -= 1.0
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, last, full_at) VALUES (?, ?, ?, ?)',
+                         (key, tokens, now, now + (capacity - tokens) / rate))
+            self._takes += 1
+            if self._takes % self.prune_every == 0:
+                conn.execute('DELETE FROM buckets WHERE full_at < ?', (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+
+def backend_from_url(url):
+    """``memory``, ``shm[:path]`` or ``sqlite:path``."""
+    kind, _, path = url.partition(':')
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'shm':
+        return SharedMemoryBackend(path) if path else SharedMemoryBackend()
+    if kind == 'sqlite':
+        return SQLiteBackend(path or 'rate_limit.db')
+    raise ValueError(f'unknown rate limit backend: {url}')
+
+
+class RateLimiter:
+    """Allow ``limit`` hits per ``period`` seconds per key, with bursts up to ``limit``."""
+
+    def __init__(self, limit, period, backend=None, prefix=''):
+        self.capacity = float(limit)
+        self.rate = limit / period
+        self.backend = backend or MemoryBackend()
+        self.prefix = prefix
+
+    @classmethod
+    def parse(cls, spec, backend=None, prefix=''):
+        """Build a limiter from ``limit/period_seconds`` such as ``10/60``."""
+        limit, _, period = spec.partition('/')
+        return cls(int(limit), float(period or 60), backend, prefix)
+
+    def hit(self, key):
+        """Count one attempt for ``key``; return 0.0 if allowed, else seconds to wait."""
+        # CLOCK_MONOTONIC is system-wide, so workers sharing a backend agree on it.
+        return self.backend.take(self.prefix + str(key), self.capacity, self.rate, time.monotonic())
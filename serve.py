@@ -0,0 +1,218 @@
+import argparse
+import glob
+import importlib
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger('serve')
+
+
+def load_app(spec):
+    """Load ``module:attr``; a callable attribute (app factory) is called."""
+    module_name, _, attr = spec.partition(':')
+    target = getattr(importlib.import_module(module_name), attr or 'create_app')
+    return target() if callable(target) and not hasattr(target, 'wsgi_app') else target
+
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Arbiter:
+    """Prefork master: owns the listening socket and keeps ``workers`` children alive.
+
+    SIGHUP forks a fresh generation of workers and then retires the old one,
+    so the socket never stops accepting. SIGTERM/SIGINT drain and exit.
+    SIGTTIN/SIGTTOU add or remove a worker.
+    """
+
+    def __init__(self, spec, sock, workers, threads=True, preload=False):
+        self.spec = spec
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.app = load_app(spec) if preload else None
+        self.children = {}  # pid -> generation
+        self.generation = 0
+        self.stopping = False
+        self._signals = []
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_w, False)
+
+    def run(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD,
+                    signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, self._queue_signal)
+        self.spawn_missing()
+        while True:
+            os.read(self._wakeup_r, 1)
+            while self._signals:
+                sig = self._signals.pop(0)
+                if sig in (signal.SIGTERM, signal.SIGINT):
+                    self.stop()
+                    return
+                if sig == signal.SIGHUP:
+                    self.reload()
+                elif sig == signal.SIGTTIN:
+                    self.workers += 1
+                elif sig == signal.SIGTTOU and self.workers > 1:
+                    self.workers -= 1
+                    self.retire(list(self.children)[:1])
+                self.reap()
+                self.spawn_missing()
+
+    def _queue_signal(self, sig, frame):
+        self._signals.append(sig)
+        try:
+            os.write(self._wakeup_w, b'.')
+        except BlockingIOError:
+            pass
+
+    def spawn_missing(self):
+        current = [pid for pid, gen in self.children.items() if gen == self.generation]
+        for _ in range(self.workers - len(current)):
+            self.spawn()
+
+    def spawn(self):
+        started = time.monotonic()
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return pid
+        code = 1
+        try:
+            code = Worker(self, started).run()
+        except BaseException:
+            logger.exception('worker %s crashed', os.getpid())
+        finally:
+            os._exit(code)
+
+    def reload(self):
+        logger.info('reloading: starting generation %s', self.generation + 1)
+        old = list(self.children)
+        self.generation += 1
+        self.spawn_missing()
+        self.retire(old)
+
+    def retire(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if self.children.pop(pid, None) is not None and not self.stopping:
+                code = os.waitstatus_to_exitcode(status)
+                logger.info('worker %s exited with status %s', pid, code)
+                if code:
+                    time.sleep(0.5)  # don't spin if workers fail on startup
+
+    def stop(self, timeout=30.0):
+        self.stopping = True
+        self.retire(list(self.children))
+        deadline = time.monotonic() + timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+
+
+class Worker:
+    def __init__(self, arbiter, started):
+        self.arbiter = arbiter
+        self.started = started
+
+    def run(self):
+        from werkzeug.serving import make_server
+
+        arbiter = self.arbiter
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGCHLD, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master handles Ctrl+C
+        os.close(arbiter._wakeup_r)
+        os.close(arbiter._wakeup_w)
+
+        app = arbiter.app or load_app(arbiter.spec)
+        host, port = arbiter.sock.getsockname()[:2]
+        server = make_server(host, port, app, threaded=arbiter.threads, fd=arbiter.sock.fileno())
+        # Let in-flight requests finish when shutting down.
+        server.daemon_threads = False
+        server.block_on_close = True
+
+        def shutdown(sig, frame):
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        logger.info('worker %s ready in %.1f ms', os.getpid(), (time.monotonic() - self.started) * 1e3)
+        server.serve_forever(poll_interval=0.5)
+        server.server_close()
+
+        extensions = getattr(app, 'extensions', {})
+        if extensions.get('event_log') is not None:
+            extensions['event_log'].close()
+        if extensions.get('metrics') is not None and extensions['metrics'].directory:
+            extensions['metrics'].flush()
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a Flask app with prefork worker processes.')
+    parser.add_argument('app', nargs='?', default='app7:create_app', help='module:factory_or_app')
+    parser.add_argument('-b', '--bind', default='127.0.0.1:5000', help='host:port')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--backlog', type=int, default=2048, help='listen() accept backlog')
+    parser.add_argument('--no-threads', dest='threads', action='store_false',
+                        help='handle one request at a time per worker')
+    parser.add_argument('--preload', action='store_true',
+                        help='build the app once in the master (faster forks, no code reload on SIGHUP)')
+    parser.add_argument('--access-log', action='store_true', help='log every request to stderr')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[serve] %(message)s', stream=sys.stderr)
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    # Workers publish their metrics here so /metrics can merge them.
+    metrics_tmp = None
+    if os.environ.get('METRICS_DIR'):
+        for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], 'metrics-*.json')):
+            os.remove(path)
+    else:
+        metrics_tmp = os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='app7-metrics-')
+
+    host, _, port = args.bind.rpartition(':')
+    sock = bind_socket(host.strip('[]') or '127.0.0.1', int(port), args.backlog)
+    logger.info('listening on %s with %s workers (pid %s)', args.bind, args.workers, os.getpid())
+    try:
+        Arbiter(args.app, sock, args.workers, threads=args.threads, preload=args.preload).run()
+    finally:
+        if metrics_tmp:
+            shutil.rmtree(metrics_tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
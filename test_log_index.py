@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from log_index import LogIndex
+
+RECORDS = [
+    {'event': 'login', 'user_id': 1, 'email': 'a@example.com', 'ip': '10.0.0.1'},
+    {'event': 'login', 'user_id': 'auth0|abc', 'email': 'b@example.com', 'ip': '10.0.0.2'},
+    {'event': 'login', 'user_id': 2 ** 40, 'email': 'c@example.com', 'ip': '10.0.0.1'},
+    {'event': 'protected', 'user_id': 1, 'email': 'a@example.com', 'ip': '10.0.0.1'},
+    {'event': 'logout', 'user_id': None, 'email': 'a@example.com', 'ip': '10.0.0.1'},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    log = tmp_path / 'requests.jsonl'
+    with open(log, 'w') as f:
+        for i, record in enumerate(RECORDS):
+            f.write(json.dumps({**record, 'time': f'2025-07-01T00:{i:02d}:00+00:00'}) + '\n')
+    index = LogIndex(str(tmp_path / 'idx'))
+    index.update([str(log)])
+    return index
+
+
+def test_user_ids_keep_their_type(index):
+    assert index.group_by('user_id') == {1: 2, 'auth0|abc': 1, 2 ** 40: 1, None: 1}
+    assert [r.get('user_id') for r in index.records(event='login')] == [1, 'auth0|abc', 2 ** 40]
+
+
+def test_outdated_index_is_rebuilt(index, tmp_path):
+    meta_path = tmp_path / 'idx' / 'meta.json'
+    meta = json.loads(meta_path.read_text())
+    del meta['format']
+    meta_path.write_text(json.dumps(meta))
+    rebuilt = LogIndex(str(tmp_path / 'idx'))
+    assert rebuilt.update([str(tmp_path / 'requests.jsonl')]) == len(RECORDS)
+    assert rebuilt.count() == len(RECORDS)
+
+
+def test_sorted_bins_match_row_by_row(index):
+    unsorted = LogIndex(index.directory)
+    unsorted.meta['sorted'] = False
+    since = index.column('ts')[1]
+    for args in [(120,), (120, None, 'login'), (120, 'user_id'), (60, 'ip', 'login', since)]:
+        assert index.bins(*args) == unsorted.bins(*args)
+    assert index.bins(120) == {1751328000.0: 2, 1751328120.0: 2, 1751328240.0: 1}
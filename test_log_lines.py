@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from log_lines import iter_events, line_utc_offset, parse_access_line, parse_tz
+
+LINES = [
+    '[INFO] 2025-07-01 15:18:40 | 127.0.0.1 - - [01/Jul/2025 15:18:40] "GET /login HTTP/1.1" 200 -\n',
+    '[WARNING] 2025-07-01 15:18:44 | Failed login attempt | email=a@example.com | IP=127.0.0.1\n',
+    '[INFO] 2025-07-01 15:18:48 | Login | user_id=1 | email=a@example.com | time=2025-07-01 19:18:48.990975\n',
+    # The writer's clock moved to UTC-5.
+    '[INFO] 2025-07-01 14:30:00 | Logout | email=a@example.com | time=2025-07-01 19:30:00.5+00:00 | IP=127.0.0.1\n',
+    '[INFO] 2025-07-01 14:31:00 | User logged out\n',
+]
+
+
+def _utc(text):
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp()
+
+
+def test_line_utc_offset():
+    assert line_utc_offset(LINES[2]) == -4 * 3600
+    assert line_utc_offset(LINES[3]) == -5 * 3600
+    assert line_utc_offset(LINES[0]) is None
+
+
+def test_parse_tz():
+    assert parse_tz('UTC') == 0
+    assert parse_tz('-04:00') == parse_tz('-4') == parse_tz('-0400') == -4 * 3600
+    assert parse_tz('+05:30') == 5 * 3600 + 1800
+
+
+def test_asctime_lines_follow_writer_offset(tmp_path):
+    path = tmp_path / 'app.log'
+    path.write_text(''.join(LINES))
+    stamps = [ts for *_, ts in iter_events(str(path))]
+    # The failed login before the first time= line uses the offset found further on.
+    assert stamps == [
+        _utc('2025-07-01 19:18:44'),
+        _utc('2025-07-01 19:18:48.990975'),
+        _utc('2025-07-01 19:30:00.5'),
+        _utc('2025-07-01 19:31:00'),
+    ]
+    assert [ts for *_, ts in iter_events(str(path), utc_offset=0)][0] == _utc('2025-07-01 15:18:44')
+    assert parse_access_line(LINES[0], -4 * 3600)[4] == _utc('2025-07-01 19:18:40')
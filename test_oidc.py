@@ -0,0 +1,94 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+from authlib.jose import JsonWebKey, jwt
+
+from oidc import OIDCClient, OIDCError
+from oidc_stub import StubIdP, make_handler
+
+JWKS = '/.well-known/jwks.json'
+
+
+@pytest.fixture
+def idp():
+    idp = StubIdP('', 'stub-client', 'stub-secret')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(idp))
+    idp.issuer = f'http://127.0.0.1:{server.server_port}/'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield idp
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(idp):
+    client = OIDCClient(idp.issuer, 'stub-client', 'stub-secret', 'http://127.0.0.1/callback')
+    client.provider.start()
+    # Let the background refresher finish its first fetch so JWKS hits can be counted.
+    deadline = time.monotonic() + 10
+    while client.provider._keys is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return client
+
+
+def _hits(idp, path):
+    with idp._lock:
+        return idp.hits[path]
+
+
+def _login(idp, client, nonce='n-1'):
+    url = idp.authorize({'redirect_uri': client.redirect_uri, 'nonce': nonce, 'state': 's'})
+    code = url.split('code=')[1].split('&')[0]
+    return client.fetch_token(code)['id_token']
+
+
+def _mint(idp, key=None, drop=(), **claims):
+    now = int(time.time())
+    claims = {'sub': 'stub|a@example.com', 'iss': idp.issuer, 'aud': idp.client_id, 'nonce': 'n-1',
+              'iat': now, 'exp': now + 3600, **claims}
+    key = key or idp.key
+    return jwt.encode({'alg': 'RS256', 'kid': key.kid},
+                      {k: v for k, v in claims.items() if k not in drop}, key).decode()
+
+
+def test_login_round_trip(idp, client):
+    claims = client.verify_id_token(_login(idp, client), 'n-1')
+    assert claims['sub'] == 'stub|admin@example.com'
+    assert client.userinfo(claims)['email'] == 'admin@example.com'
+
+
+def test_nonce_mismatch(idp, client):
+    with pytest.raises(OIDCError):
+        client.verify_id_token(_login(idp, client, nonce='n-1'), 'n-2')
+
+
+@pytest.mark.parametrize('claim', ['exp', 'iat'])
+def test_missing_exp_or_iat(idp, client, claim):
+    client.verify_id_token(_mint(idp), 'n-1')
+    with pytest.raises(OIDCError):
+        client.verify_id_token(_mint(idp, drop=(claim,)), 'n-1')
+
+
+@pytest.mark.parametrize('claims', [{'aud': 'someone-else'}, {'iss': 'https://evil.example.com/'}])
+def test_wrong_audience_or_issuer(idp, client, claims):
+    with pytest.raises(OIDCError):
+        client.verify_id_token(_mint(idp, **claims), 'n-1')
+
+
+def test_keys_refetched_after_rotation(idp, client):
+    client.verify_id_token(_login(idp, client), 'n-1')
+    before = _hits(idp, JWKS)
+    idp.rotate()
+    assert client.verify_id_token(_login(idp, client), 'n-1')['sub'] == 'stub|admin@example.com'
+    assert _hits(idp, JWKS) == before + 1
+
+
+def test_unknown_kid_refetches_at_most_once(idp, client):
+    forged = JsonWebKey.generate_key('RSA', 2048, {'kid': 'forged'}, is_private=True)
+    before = _hits(idp, JWKS)
+    for _ in range(3):
+        with pytest.raises(OIDCError):
+            client.verify_id_token(_mint(idp, key=forged), 'n-1')
+    assert _hits(idp, JWKS) == before + 1
@@ -0,0 +1,89 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from rate_limit import MemoryBackend, RateLimiter, SharedMemoryBackend, SQLiteBackend
+
+CAPACITY = 2000
+THREADS = 8
+
+
+@pytest.fixture(params=['memory', 'shm', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBackend()
+    if request.param == 'shm':
+        return SharedMemoryBackend(str(tmp_path / 'rate-limit'), slots=1024, shards=16)
+    return SQLiteBackend(str(tmp_path / 'rate_limit.db'))
+
+
+@pytest.fixture(autouse=True)
+def frequent_thread_switches():
+    # Switch threads as often as possible so unguarded read-modify-writes race.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def _hammer(limiter, hits):
+    allowed = [0] * THREADS
+    start = threading.Barrier(THREADS)
+
+    def run(i):
+        start.wait()
+        for _ in range(hits):
+            if not limiter.hit('127.0.0.1'):
+                allowed[i] += 1
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(allowed)
+
+
+def test_threads_never_exceed_capacity(backend):
+    # A period this long means no refill during the test.
+    limiter = RateLimiter(CAPACITY, 10 ** 9, backend)
+    hits = CAPACITY // THREADS * 2 if isinstance(backend, SQLiteBackend) else CAPACITY
+    assert _hammer(limiter, hits) == CAPACITY
+
+
+def test_shared_memory_processes_and_threads(tmp_path):
+    path = str(tmp_path / 'rate-limit')
+    limiter = RateLimiter(CAPACITY, 10 ** 9, SharedMemoryBackend(path, slots=1024, shards=16))
+    read, write = os.pipe()
+    pids = []
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            os.write(write, b'%d\n' % _hammer(limiter, CAPACITY // 2))
+            os._exit(0)
+        pids.append(pid)
+    os.close(write)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    with os.fdopen(read) as f:
+        assert sum(int(line) for line in f) == CAPACITY
+
+
+def test_retry_after_when_empty():
+    limiter = RateLimiter(2, 60)
+    assert limiter.hit('a') == 0.0
+    assert limiter.hit('a') == 0.0
+    assert 0.0 < limiter.hit('a') <= 30.0
+    assert limiter.hit('b') == 0.0
+
+
+def test_sqlite_prunes_refilled_buckets(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'rate_limit.db'), prune_every=10)
+    for i in range(9):
+        backend.take(f'ip{i}', 5.0, 1.0, now=0.0)
+    backend.take('late', 5.0, 1.0, now=100.0)
+    rows = backend._connect().execute('SELECT key FROM buckets').fetchall()
+    assert rows == [('late',)]
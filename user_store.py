@@ -0,0 +1,284 @@
+import argparse
+import base64
+import contextlib
+import csv
+import hashlib
+import hmac
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+
+HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 260000))
+
+
+class UserStoreBusy(Exception):
+    """Raised when too many password checks are already waiting for the pool."""
+
+
+# --- Password hashing ---
+def hash_password(password, salt=None, iterations=HASH_ITERATIONS):
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return '$'.join((
+        'pbkdf2_sha256',
+        str(iterations),
+        base64.b64encode(salt).decode(),
+        base64.b64encode(digest).decode(),
+    ))
+
+
+def check_password(password, encoded):
+    try:
+        algorithm, iterations, salt, digest = encoded.split('$')
+    except (AttributeError, ValueError):
+        return False
+    if algorithm != 'pbkdf2_sha256' or not isinstance(password, str):
+        return False
+    candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), base64.b64decode(salt), int(iterations))
+    return hmac.compare_digest(candidate, base64.b64decode(digest))
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash():
+    # Compared against when the email is unknown, so misses cost the same as hits.
+    return hash_password('dummy-password')
+
+
+class LRUCache:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class UserStore:
+    """Base class for user backends.
+
+    Subclasses implement ``_load(email)`` returning a record dict
+    (``user_id``, ``email``, ``password_hash``) or ``None``. Found records are
+    kept in an LRU cache and password checks run in a bounded thread pool
+    (``hashlib.pbkdf2_hmac`` releases the GIL, so checks run in parallel).
+    """
+
+    def __init__(self, max_workers=4, max_pending=64, cache_size=4096):
+        self.max_workers = max_workers
+        self._cache = LRUCache(cache_size)
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._pool_owner = None
+
+    @property
+    def _pool(self):
+        if self._pool_owner != os.getpid():
+            # A pool inherited through fork has no live threads; each worker needs its own.
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-check')
+            self._pool_owner = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args, timeout=5.0):
+        """Run ``fn`` in the bounded pool, raising ``UserStoreBusy`` when it is saturated."""
+        if not self._pending.acquire(timeout=timeout):
+            raise UserStoreBusy()
+        try:
+            return self._pool.submit(fn, *args).result(timeout)
+        except TimeoutError:
+            raise UserStoreBusy() from None
+        finally:
+            self._pending.release()
+
+    def _load(self, email):
+        raise NotImplementedError
+
+    def get(self, email):
+        user = self._cache.get(email)
+        if user is None:
+            user = self._load(email)
+            # Misses are not cached: random emails would evict real accounts,
+            # and an account imported later must work without a restart.
+            if user is not None:
+                self._cache.set(email, user)
+        return user
+
+    def verify(self, email, password, timeout=5.0):
+        """Return the user record if ``password`` matches, otherwise ``None``."""
+        user = self.get(email) if email and isinstance(email, str) else None
+        encoded = user['password_hash'] if user else self._run(_dummy_hash, timeout=timeout)
+        ok = self._run(check_password, password, encoded, timeout=timeout)
+        return user if ok and user else None
+
+    def close(self):
+        if self._pool_owner == os.getpid():
+            self._executor.shutdown(wait=False)
+
+
+class MemoryUserStore(UserStore):
+    """Users from a ``{email: {'password': ..., 'user_id': ...}}`` dict.
+
+    Passwords are hashed in the password pool on first lookup rather than
+    up front, so building the store (and starting a worker) stays cheap.
+    """
+
+    def __init__(self, users, **kwargs):
+        super().__init__(**kwargs)
+        self._users = users
+
+    def _load(self, email):
+        user = self._users.get(email)
+        if user is None:
+            return None
+        password_hash = self._run(hash_password, user['password'])
+        return {'user_id': user['user_id'], 'email': email, 'password_hash': password_hash}
+
+
+class SQLiteUserStore(UserStore):
+    """Users in a SQLite table indexed by email.
+
+    Each worker process keeps a small pool of connections, opened on first
+    use and checked out around every query, so nothing is read at startup
+    and short-lived request threads do not each open their own.
+    """
+
+    def __init__(self, path, pool_size=4, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.pool_size = pool_size
+        self._pool_pid = None
+        with self._connection() as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS users ('
+                'user_id INTEGER PRIMARY KEY, '
+                'email TEXT NOT NULL, '
+                'password_hash TEXT NOT NULL)'
+            )
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS users_email ON users (email)')
+
+    @contextlib.contextmanager
+    def _connection(self):
+        if self._pool_pid != os.getpid():
+            # Connections must not be shared with the parent after a fork.
+            self._connections = queue.LifoQueue(self.pool_size)
+            self._pool_pid = os.getpid()
+        connections = self._connections
+        try:
+            conn = connections.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            try:
+                connections.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def _load(self, email):
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT user_id, email, password_hash FROM users WHERE email = ?', (email,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'user_id': row[0], 'email': row[1], 'password_hash': row[2]}
+
+    def is_empty(self):
+        with self._connection() as conn:
+            return conn.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+
+    def bulk_import(self, rows, hashed=False, chunk=5000):
+        """Insert or update ``(email, password, user_id)`` rows.
+
+        Existing emails get the new password and keep their ``user_id``
+        unless the row supplies one; ``user_id`` may be ``None`` or empty to
+        allocate one for new emails. Blank and short rows are skipped. Plain
+        passwords are hashed in the thread pool unless ``hashed`` is true.
+        Returns the number of rows imported.
+        """
+        total = 0
+        batch = []
+
+        def flush():
+            passwords = [row[1] for row in batch]
+            if not hashed:
+                passwords = list(self._pool.map(hash_password, passwords))
+            with_id, without_id = [], []
+            for (email, _, user_id), password_hash in zip(batch, passwords):
+                if user_id is None:
+                    without_id.append((email, password_hash))
+                else:
+                    with_id.append((user_id, email, password_hash))
+            # Upserts rather than INSERT OR REPLACE, which would delete the old
+            # row and give the email a new user_id.
+            with self._connection() as conn, conn:
+                conn.executemany(
+                    'INSERT INTO users (email, password_hash) VALUES (?, ?) '
+                    'ON CONFLICT (email) DO UPDATE SET password_hash = excluded.password_hash',
+                    without_id,
+                )
+                conn.executemany(
+                    'INSERT INTO users (user_id, email, password_hash) VALUES (?, ?, ?) '
+                    'ON CONFLICT (email) DO UPDATE SET '
+                    'user_id = excluded.user_id, password_hash = excluded.password_hash',
+                    with_id,
+                )
+
+        for row in rows:
+            if len(row) < 2 or not row[0] or not row[1]:
+                continue
+            email, password, *rest = row
+            batch.append((email, password, rest[0] if rest and rest[0] not in ('', None) else None))
+            if len(batch) >= chunk:
+                flush()
+                total += len(batch)
+                batch = []
+        if batch:
+            flush()
+            total += len(batch)
+        self._cache.clear()
+        return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import accounts into a SQLite user store.')
+    parser.add_argument('database', help='SQLite file (USER_DB)')
+    parser.add_argument('csv', help='CSV with email,password[,user_id] rows')
+    parser.add_argument('--hashed', action='store_true', help='password column is already hashed')
+    parser.add_argument('--skip-header', action='store_true', help='ignore the first CSV row')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args(argv)
+
+    store = SQLiteUserStore(args.database, max_workers=args.workers)
+    with open(args.csv, newline='', encoding='utf-8') as f:
+        rows = csv.reader(f)
+        if args.skip_header:
+            next(rows, None)
+        count = store.bulk_import(rows, hashed=args.hashed)
+    print(f'Imported {count} users into {args.database}')
+    store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())